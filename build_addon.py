@@ -1,11 +1,39 @@
 #!/usr/bin/env python
 """Build script for Hibiki NVDA add-on"""
 
+import ast
+import hashlib
 import os
+import sys
 import zipfile
 import configparser
 import subprocess
 import glob
+import tempfile
+
+# Add-on plugin code and default sounds, relative to the repository root
+PLUGIN_DIR = os.path.join("hibiki", "globalPlugins", "hibiki")
+SOUNDS_DIR = os.path.join(PLUGIN_DIR, "sounds")
+
+# Tables in the plugin sources that name default sound files, by module
+SOUND_TABLES = {
+    "roleMapper.py": ("_ROLE_DEFINITIONS", "_STATE_DEFINITIONS", "_HEADING_LEVEL_SOUNDS"),
+    "soundCustomizationDialog.py": ("DEFAULT_SOUNDS",),
+}
+
+# Sounds shipped even though no table uses them, e.g. to offer them for
+# customization (file names in SOUNDS_DIR)
+EXTRA_SOUNDS = ()
+
+# Golden output of the stereo backend's rendering: 16-bit mono samples and
+# their sample rate, then (azimuth, gain) -> interleaved stereo samples
+# rendered with the interaural time difference
+STEREO_GOLDEN_INPUT = ((12000, -12000, 32767, -32768), 8000)
+STEREO_GOLDEN_OUTPUT = {
+    (-90, 1.0): (12000, 0, -12000, 0, 32767, 0, -32768, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0),
+    (0, 1.0): (8485, 8485, -8485, -8485, 23169, 23169, -23170, -23170),
+    (50, 0.5): (0, 5638, 0, -5638, 0, 15395, 2052, -15395, -2052, 0, 5603, 0, -5603, 0),
+}
 
 def get_version_from_manifest(manifest_path):
     """
@@ -62,11 +90,177 @@ def compile_translations():
 
     print()
 
+def import_plugin_module(name):
+    """
+    Import a standard-library-only module of the plugin.
+
+    Args:
+        name: Module name (e.g. "soundBank")
+
+    Returns:
+        The module
+    """
+    sys.path.insert(0, PLUGIN_DIR)
+    try:
+        return __import__(name)
+    finally:
+        sys.path.remove(PLUGIN_DIR)
+
+def find_referenced_sounds():
+    """
+    Collect the sound files named by the role, state and default sound tables.
+
+    The plugin modules import NVDA, so their sources are parsed rather than
+    imported.
+
+    Returns:
+        Set of sound file names
+    """
+    referenced = set()
+    for module, tables in SOUND_TABLES.items():
+        with open(os.path.join(PLUGIN_DIR, module), 'r', encoding='utf-8') as f:
+            tree = ast.parse(f.read(), module)
+        found = set()
+        for node in tree.body:
+            if not isinstance(node, ast.Assign):
+                continue
+            names = [target.id for target in node.targets if isinstance(target, ast.Name)]
+            if not any(name in tables for name in names):
+                continue
+            found.update(names)
+            for value in ast.walk(node.value):
+                if isinstance(value, ast.Constant) and isinstance(value.value, str) \
+                        and value.value.lower().endswith('.wav'):
+                    referenced.add(value.value)
+        for table in tables:
+            if table not in found:
+                print(f"  Warning: {table} not found in {module}")
+    return referenced
+
+def plan_sound_assets():
+    """
+    Choose which sound files to ship.
+
+    Only sounds referenced by the sound tables (or listed in EXTRA_SOUNDS)
+    are shipped, and files with identical content are shipped once; the
+    dropped copies become aliases of the shipped file.
+
+    Returns:
+        tuple (set of shipped file names, dict mapping alias to shipped name)
+    """
+    print("Selecting sounds...")
+    available = sorted(
+        name for name in os.listdir(SOUNDS_DIR)
+        if name.lower().endswith('.wav') and os.path.isfile(os.path.join(SOUNDS_DIR, name))
+    )
+    wanted = find_referenced_sounds() | set(EXTRA_SOUNDS)
+    for name in sorted(wanted.difference(available)):
+        print(f"  Warning: {name} is referenced but missing")
+
+    unused_bytes = 0
+    by_content = {}
+    for name in available:
+        path = os.path.join(SOUNDS_DIR, name)
+        if name not in wanted:
+            unused_bytes += os.path.getsize(path)
+            continue
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).digest()
+        by_content.setdefault(digest, []).append(name)
+
+    shipped = set()
+    aliases = {}
+    duplicate_bytes = 0
+    for names in by_content.values():
+        shipped.add(names[0])
+        for name in names[1:]:
+            aliases[name] = names[0]
+            duplicate_bytes += os.path.getsize(os.path.join(SOUNDS_DIR, name))
+
+    unused = len(available) - len(shipped) - len(aliases)
+    print(f"  Shipping {len(shipped)} of {len(available)} sounds")
+    print(f"  Skipped {unused} unused sounds ({unused_bytes / 1024:.1f} KB)")
+    print(f"  Skipped {len(aliases)} duplicate sounds ({duplicate_bytes / 1024:.1f} KB)")
+    print()
+    return shipped, aliases
+
+def build_sound_bank(bank_path, names):
+    """
+    Write the pre-decoded sound bank for the default sounds.
+
+    Every shipped WAV file is decoded and stored as 16-bit mono PCM, so the
+    add-on can load all of them with a single memory map.
+
+    Args:
+        bank_path: Path of the bank file to write
+        names: File names of the sounds to include
+
+    Returns:
+        True if the bank was written
+    """
+    audioData = import_plugin_module("audioData")
+    soundBank = import_plugin_module("soundBank")
+
+    print("Building sound bank...")
+    sounds = []
+    for name in sorted(names):
+        wav_path = os.path.join(SOUNDS_DIR, name)
+        try:
+            decoded = audioData.decode_wav(wav_path)
+            pcm = audioData.to_pcm16_mono(decoded)
+        except Exception as e:
+            print(f"  Warning: skipping {name}: {e}")
+            continue
+        sounds.append((name, decoded.rate, pcm.tobytes()))
+
+    if not sounds:
+        print("No sounds found for the sound bank.")
+        return False
+
+    count, data_size = soundBank.write_bank(bank_path, sounds)
+    print(f"  {count} sounds, {data_size / 1024:.1f} KB of PCM")
+    print()
+    return True
+
+def check_stereo_rendering():
+    """
+    Check the stereo backend's rendering against golden output.
+
+    The pure Python rendering is always checked, and the NumPy one too if
+    NumPy is installed, so the backend sounds the same with or without it.
+
+    Returns:
+        True if every rendering matches
+    """
+    from array import array
+    stereoPanning = import_plugin_module("stereoPanning")
+
+    print("Checking stereo rendering...")
+    renderers = [("Python", stereoPanning.render_stereo_python)]
+    if stereoPanning.numpy is not None:
+        renderers.append(("NumPy", stereoPanning.render_stereo))
+    samples, rate = STEREO_GOLDEN_INPUT
+    samples = array('h', samples)
+    passed = True
+    for label, render in renderers:
+        for (azimuth, gain), expected in STEREO_GOLDEN_OUTPUT.items():
+            rendered = tuple(array('h', render(samples, rate, azimuth, gain)))
+            if rendered != expected:
+                print(f"  {label} rendering at {azimuth} degrees, gain {gain}: {rendered}")
+                print(f"  expected: {expected}")
+                passed = False
+    print(f"  {'OK' if passed else 'FAILED'} ({', '.join(label for label, _render in renderers)})")
+    print()
+    return passed
+
 def build_addon():
     """Build the .nvda-addon file (which is a ZIP archive)"""
     # Compile translations first
     compile_translations()
 
+    if not check_stereo_rendering():
+        sys.exit("Stereo rendering doesn't match its golden output")
+
     source_dir = "hibiki"
     manifest_path = os.path.join(source_dir, "manifest.ini")
 
@@ -74,18 +268,39 @@ def build_addon():
     version = get_version_from_manifest(manifest_path)
     addon_name = f"Hibiki-{version}.nvda-addon"
 
+    shipped_sounds, sound_aliases = plan_sound_assets()
+    soundAssets = import_plugin_module("soundAssets")
+
     print(f"Building {addon_name}...")
 
-    with zipfile.ZipFile(addon_name, 'w', zipfile.ZIP_DEFLATED) as addon_zip:
+    with tempfile.TemporaryDirectory() as build_dir, \
+            zipfile.ZipFile(addon_name, 'w', zipfile.ZIP_DEFLATED) as addon_zip:
         # Walk through the hibiki directory
         for root, dirs, files in os.walk(source_dir):
+            in_sounds_dir = os.path.normpath(root) == os.path.normpath(SOUNDS_DIR)
             for file in files:
+                # Unused and duplicate sounds are left out (see plan_sound_assets)
+                if in_sounds_dir and file not in shipped_sounds:
+                    continue
                 file_path = os.path.join(root, file)
                 # Calculate the archive name (relative to hibiki dir)
                 arcname = os.path.relpath(file_path, source_dir)
                 print(f"Adding: {arcname}")
                 addon_zip.write(file_path, arcname)
 
+        # Add the alias manifest and the generated sound bank next to the sounds
+        aliases_path = os.path.join(build_dir, soundAssets.ALIASES_FILENAME)
+        soundAssets.write_aliases(aliases_path, sound_aliases)
+        arcname = os.path.relpath(os.path.join(SOUNDS_DIR, soundAssets.ALIASES_FILENAME), source_dir)
+        print(f"Adding: {arcname}")
+        addon_zip.write(aliases_path, arcname)
+
+        bank_path = os.path.join(build_dir, "sounds.bank")
+        if build_sound_bank(bank_path, shipped_sounds):
+            arcname = os.path.relpath(os.path.join(SOUNDS_DIR, "sounds.bank"), source_dir)
+            print(f"Adding: {arcname}")
+            addon_zip.write(bank_path, arcname)
+
     print(f"\nSuccessfully built {addon_name}")
     print(f"Size: {os.path.getsize(addon_name) / 1024:.1f} KB")
 
@@ -2,22 +2,59 @@
 # Part of Hibiki add-on for NVDA
 
 import os
-import types
+import threading
+import time
+import wx
+import config
 import globalPluginHandler
 import addonHandler
 import speech
 import controlTypes
 import ui
-import api
-import textInfos
+from logHandler import log
 from scriptHandler import script
 
 from .soundPlayer import SoundPlayer
-from .roleMapper import get_sounds_for_object, ROLE_SOUND_MAP
-from .settingsPanel import init_configuration, get_config, set_config, HibikiSettingsPanel
+from .audioBackends import create_backend
+from .browseModeLocator import BrowseModeLocator
+from .speechCommands import PlayEarconCommand
+from .roleMapper import get_sound_key, get_sound_key_for_object, ROLE_SOUND_MAP
+from .settingsPanel import (
+    init_configuration, get_config, set_config,
+    get_config_snapshot, refresh_config_snapshot, post_configSnapshotChange,
+    HibikiSettingsPanel,
+)
+from .soundConversion import get_converted_path, is_converted
+from .soundCustomizationDialog import get_custom_sounds, set_custom_sounds, prune_custom_sound_cache
 
 addonHandler.initTranslation()
 
+# Seconds during which an earcon fired from a focus or navigator event keeps
+# the speech hook from playing it again for the same object
+EARLY_FIRE_TOKEN_TTL = 1.0
+
+# Speech functions hooked by Hibiki, as
+# (function name, attribute holding the original, hook method, re-exported by speech)
+_SPEECH_HOOKS = (
+    # ── Hook 1: getPropertiesSpeech ──
+    # Suppresses role/state labels from speech output when options are enabled.
+    # This is the low-level function that generates text like "button", "link", etc.
+    ("getPropertiesSpeech", "_original_getSpeechTextForProperties",
+        "_hook_getSpeechTextForProperties", True),
+    # ── Hook 2: getObjectPropertiesSpeech ──
+    # Triggers 3D sound for focus-based navigation (Tab, Shift+Tab, NVDA+numpad).
+    # Called when NVDA generates speech for an object's properties.
+    # Has direct access to the NVDA object → perfect for 3D positioning.
+    ("getObjectPropertiesSpeech", "_original_getObjectPropertiesSpeech",
+        "_hook_getObjectPropertiesSpeech", False),
+    # ── Hook 3: getControlFieldSpeech ──
+    # Triggers 3D sound for browse mode navigation (arrows, k, b, e, etc.).
+    # Called when NVDA generates speech for control fields in virtual buffers.
+    # Gets role from attrs dict; gets location from POSITION_CARET.
+    ("getControlFieldSpeech", "_original_getControlFieldSpeech",
+        "_hook_getControlFieldSpeech", True),
+)
+
 class GlobalPlugin(globalPluginHandler.GlobalPlugin):
     """
     Main global plugin for Hibiki add-on.
@@ -38,38 +75,49 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
         """Initialize the Hibiki add-on."""
         super().__init__(*args, **kwargs)
 
-        # Initialize configuration
+        # Initialize configuration and build the first config snapshot
         init_configuration()
+        refresh_config_snapshot()
+        config.post_configProfileSwitch.register(self._on_config_profile_switch)
 
         # Initialize sound player with sounds directory
-        sounds_dir = os.path.join(
-            os.path.abspath(os.path.dirname(__file__)),
-            "sounds"
-        )
-        self.sound_player = SoundPlayer(sounds_dir)
-
-        # ── Hook 1: getPropertiesSpeech ──
-        # Suppresses role/state labels from speech output when options are enabled.
-        # This is the low-level function that generates text like "button", "link", etc.
-        self._original_getSpeechTextForProperties = speech.speech.getPropertiesSpeech
-        speech.speech.getPropertiesSpeech = self._hook_getSpeechTextForProperties
-        speech.getPropertiesSpeech = speech.speech.getPropertiesSpeech
-
-        # ── Hook 2: getObjectPropertiesSpeech ──
-        # Triggers 3D sound for focus-based navigation (Tab, Shift+Tab, NVDA+numpad).
-        # Called when NVDA generates speech for an object's properties.
-        # Has direct access to the NVDA object → perfect for 3D positioning.
-        self._original_getObjectPropertiesSpeech = speech.speech.getObjectPropertiesSpeech
-        speech.speech.getObjectPropertiesSpeech = self._hook_getObjectPropertiesSpeech
-
-        # ── Hook 3: getControlFieldSpeech ──
-        # Triggers 3D sound for browse mode navigation (arrows, k, b, e, etc.).
-        # Called when NVDA generates speech for control fields in virtual buffers.
-        # Gets role from attrs dict; gets location from POSITION_CARET.
-        self._original_getControlFieldSpeech = speech.speech.getControlFieldSpeech
-        speech.speech.getControlFieldSpeech = self._hook_getControlFieldSpeech
-        # Also update the re-export at speech module level for compatibility
-        speech.getControlFieldSpeech = speech.speech.getControlFieldSpeech
+        self.sound_player = None
+        self._apply_player_settings(get_config_snapshot())
+
+        # Resolves the object at the browse mode caret for 3D positioning
+        self.browse_locator = BrowseModeLocator()
+
+        # Every gesture starts a new navigation, so the scheduler only
+        # coalesces the earcons of different key presses
+        try:
+            from inputCore import decide_executeGesture
+            decide_executeGesture.register(self._on_execute_gesture)
+        except ImportError:
+            pass
+
+        # Early fire: (object, time.perf_counter()) of the last earcon fired
+        # from an event, and counters measuring how much earlier it played
+        # than the speech hook would have played it
+        self._early_fire_token = None
+        self.early_fired = 0
+        self.early_matched = 0
+        self.early_lead_time = 0.0
+
+        # Speech hooks are only installed while Hibiki is enabled, so a
+        # disabled Hibiki adds nothing to NVDA's speech pipeline. Once
+        # terminated, hooks that had to stay installed only forward calls.
+        self._terminated = False
+        self._installed_hooks = {}
+        self._update_hooks()
+        post_configSnapshotChange.register(self._on_config_snapshot_change)
+
+        # Custom sounds chosen before they were converted when chosen are
+        # converted in the background; sounds that can't be are remembered
+        # so they aren't retried on every config change
+        self._converting_custom_sounds = False
+        self._unconvertible_sounds = set()
+        if not self._convert_custom_sounds(get_config_snapshot()):
+            prune_custom_sound_cache()
 
         # Register settings panel
         self.createMenu()
@@ -82,14 +130,31 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 
     def terminate(self):
         """Clean up when add-on is disabled."""
-        # Restore all hooks
-        speech.speech.getPropertiesSpeech = self._original_getSpeechTextForProperties
-        speech.getPropertiesSpeech = speech.speech.getPropertiesSpeech
-
-        speech.speech.getObjectPropertiesSpeech = self._original_getObjectPropertiesSpeech
+        self._terminated = True
+        config.post_configProfileSwitch.unregister(self._on_config_profile_switch)
+        try:
+            from inputCore import decide_executeGesture
+            decide_executeGesture.unregister(self._on_execute_gesture)
+        except ImportError:
+            pass
+        log.debug("Hibiki earcon plan memo: %r", self.sound_player.get_plan_stats())
+        log.debug("Hibiki location reads: %r", self.sound_player.get_location_stats())
+        log.debug("Hibiki earcon events: %r", self.sound_player.scheduler.get_stats())
+        log.debug("Hibiki duplicate earcons suppressed: %d", self.sound_player.duplicates.suppressed)
+        log.debug("Hibiki composite sounds: %r", self.sound_player.composites.get_stats())
+        log.debug("Hibiki custom sounds: %r", self.sound_player.custom_sounds.get_stats())
+        if self.early_fired:
+            log.debug("Hibiki early fire: %d fired, %d matched by speech, mean lead %.1f ms" % (
+                self.early_fired,
+                self.early_matched,
+                self.early_lead_time / max(1, self.early_matched) * 1000,
+            ))
+        self.sound_player.terminate()
+        self.browse_locator.clear()
 
-        speech.speech.getControlFieldSpeech = self._original_getControlFieldSpeech
-        speech.getControlFieldSpeech = speech.speech.getControlFieldSpeech
+        # Restore all hooks
+        post_configSnapshotChange.unregister(self._on_config_snapshot_change)
+        self._remove_hooks()
 
         # Remove settings panel
         from gui.settingsDialogs import NVDASettingsDialog
@@ -98,6 +163,173 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
         except ValueError:
             pass
 
+    def _on_execute_gesture(self, gesture):
+        """
+        Start a new navigation for a gesture about to be executed.
+
+        Args:
+            gesture: Input gesture being executed
+
+        Returns:
+            True, so the gesture is always executed
+        """
+        self.sound_player.begin_navigation()
+        return True
+
+    def _on_config_profile_switch(self):
+        """Rebuild the config snapshot for the newly active profile."""
+        refresh_config_snapshot()
+
+    def _on_config_snapshot_change(self, snapshot):
+        """Apply a new configuration snapshot to the hooks and the player."""
+        self._update_hooks(snapshot)
+        self._apply_player_settings(snapshot)
+        self._convert_custom_sounds(snapshot)
+
+    def _convert_custom_sounds(self, snapshot):
+        """
+        Start converting the custom sounds that aren't converted yet.
+
+        Args:
+            snapshot: HibikiConfig whose custom sounds are checked
+
+        Returns:
+            True if a conversion is running
+        """
+        if self._converting_custom_sounds:
+            return True
+        paths = {
+            path for path in snapshot.customSounds.values()
+            if path not in self._unconvertible_sounds and not is_converted(path)
+        }
+        if not paths:
+            return False
+        self._converting_custom_sounds = True
+        threading.Thread(
+            target=self._run_custom_sound_conversion,
+            args=(paths,),
+            name="HibikiSoundConversion",
+            daemon=True,
+        ).start()
+        return True
+
+    def _run_custom_sound_conversion(self, paths):
+        """
+        Convert custom sounds, on a background thread.
+
+        Args:
+            paths: Paths of the sound files to convert
+        """
+        converted = {}
+        for path in paths:
+            try:
+                converted[path] = get_converted_path(path)
+            except Exception:
+                log.debugWarning("Hibiki: could not convert custom sound %r" % path, exc_info=True)
+                converted[path] = None
+        wx.CallAfter(self._on_custom_sounds_converted, converted)
+
+    def _on_custom_sounds_converted(self, converted):
+        """
+        Replace custom sounds by their converted versions, on the GUI thread.
+
+        Args:
+            converted: dict mapping source path to converted path (None if
+                it couldn't be converted)
+        """
+        self._converting_custom_sounds = False
+        if self._terminated:
+            return
+        self._unconvertible_sounds.update(path for path, result in converted.items() if result is None)
+        # Re-read, as the custom sounds or the profile may have changed
+        custom_sounds = get_custom_sounds()
+        changed = False
+        for control_key, path in custom_sounds.items():
+            if converted.get(path):
+                custom_sounds[control_key] = converted[path]
+                changed = True
+        if changed:
+            # Refreshes the snapshot, which converts any sounds added since
+            set_custom_sounds(custom_sounds)
+        else:
+            self._convert_custom_sounds(get_config_snapshot())
+        prune_custom_sound_cache()
+
+    def _apply_player_settings(self, snapshot):
+        """
+        Pass playback settings on to the sound player.
+
+        The player is (re)created when it doesn't play through the
+        configured audio backend.
+
+        Args:
+            snapshot: HibikiConfig to apply
+        """
+        player = self.sound_player
+        if player is None or player.backend.name != snapshot.audioBackend:
+            try:
+                backend = create_backend(snapshot.audioBackend)
+            except KeyError:
+                log.warning("Hibiki: unknown audio backend %r" % snapshot.audioBackend)
+                backend = None
+            if player is not None:
+                player.terminate()
+            sounds_dir = os.path.join(
+                os.path.abspath(os.path.dirname(__file__)),
+                "sounds"
+            )
+            self.sound_player = SoundPlayer(sounds_dir, backend=backend)
+        self.sound_player.scheduler.window = snapshot.coalesceWindow / 1000.0
+
+    def _update_hooks(self, snapshot=None):
+        """
+        Install the speech hooks if Hibiki is enabled, remove them otherwise.
+
+        Args:
+            snapshot: HibikiConfig to use (defaults to the current snapshot)
+        """
+        if snapshot is None:
+            snapshot = get_config_snapshot()
+        if snapshot.enabled:
+            self._install_hooks()
+        else:
+            self._remove_hooks()
+
+    def _install_hooks(self):
+        """Install every speech hook that is not installed yet."""
+        for name, original_attr, hook_attr, reexported in _SPEECH_HOOKS:
+            if name in self._installed_hooks:
+                continue
+            hook = getattr(self, hook_attr)
+            setattr(self, original_attr, getattr(speech.speech, name))
+            setattr(speech.speech, name, hook)
+            if reexported:
+                # Also update the re-export at speech module level for compatibility
+                setattr(speech, name, hook)
+            self._installed_hooks[name] = hook
+
+    def _remove_hooks(self):
+        """
+        Remove every installed speech hook, restoring the original functions.
+
+        If another add-on has since wrapped one of our hooks, that add-on
+        calls our hook as its original, so restoring the function would cut
+        it out of the chain. Such a hook is left installed; it forwards to
+        the original untouched while Hibiki is disabled, and does nothing
+        else once the add-on is terminated.
+        """
+        for name, original_attr, _hook_attr, reexported in _SPEECH_HOOKS:
+            hook = self._installed_hooks.get(name)
+            if hook is None:
+                continue
+            if getattr(speech.speech, name) is not hook:
+                continue
+            original = getattr(self, original_attr)
+            setattr(speech.speech, name, original)
+            if reexported and getattr(speech, name) is hook:
+                setattr(speech, name, original)
+            del self._installed_hooks[name]
+
     def is_enabled(self):
         """
         Check if the add-on is currently enabled.
@@ -105,7 +337,7 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
         Returns:
             True if enabled, False otherwise
         """
-        return get_config("enabled")
+        return get_config_snapshot().enabled
 
     # ===== Speech Generation Hooks =====
 
@@ -121,12 +353,15 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
         avoiding TypeError when NVDA omits the 'reason' parameter.
         Wrapped in try/except to never break NVDA's speech pipeline.
         """
+        if self._terminated:
+            return self._original_getSpeechTextForProperties(*args, **kwargs)
         try:
-            if self.is_enabled():
-                if get_config("suppressRoleLabels"):
+            cfg = get_config_snapshot()
+            if cfg.enabled:
+                if cfg.suppressRoleLabels:
                     if 'role' in kwargs:
                         del kwargs['role']
-                if get_config("suppressStateLabels"):
+                if cfg.suppressStateLabels:
                     if 'states' in kwargs:
                         del kwargs['states']
         except Exception:
@@ -142,7 +377,10 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
         navigation (NVDA+numpad arrows).
 
         The object is available directly, so 3D positioning uses obj.location.
-        Sound plays during speech generation, ensuring perfect synchronization.
+        Sound plays during speech generation, or when the speech is spoken
+        if syncWithSpeech is enabled (see _attach_earcon). With earlyFire,
+        it doesn't play again for an object whose earcon a focus or navigator
+        event just played.
 
         Args:
             obj: NVDA object whose properties are being spoken
@@ -150,19 +388,30 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
             _prefixSpeechCommand: Optional prefix command
             **allowedProperties: Which properties to include (role, states, etc.)
         """
+        if self._terminated:
+            return self._original_getObjectPropertiesSpeech(
+                obj, reason, _prefixSpeechCommand, **allowedProperties
+            )
+        cfg = get_config_snapshot()
+        plan = None
         try:
-            if self.is_enabled() and obj is not None:
+            if cfg.enabled and obj is not None:
                 # Only play sound if NVDA is going to announce the role
-                if allowedProperties.get('role', False):
-                    sound_filenames = get_sounds_for_object(obj)
-                    if sound_filenames:
-                        self.sound_player.play_for_object(obj, sound_filenames)
+                if allowedProperties.get('role', False) and not (
+                    cfg.earlyFire and self._consume_early_fire_token(obj)
+                ):
+                    plan = self.sound_player.get_plan(get_sound_key_for_object(obj))
+                    if plan and not cfg.syncWithSpeech:
+                        self.sound_player.play_for_object(obj, plan)
         except Exception:
-            pass
+            plan = None
 
-        return self._original_getObjectPropertiesSpeech(
+        sequence = self._original_getObjectPropertiesSpeech(
             obj, reason, _prefixSpeechCommand, **allowedProperties
         )
+        if plan and cfg.syncWithSpeech:
+            self._attach_earcon(sequence, obj, plan)
+        return sequence
 
     def _hook_getControlFieldSpeech(self, attrs, ancestorAttrs, fieldType, formatConfig=None, extraDetail=False, reason=None):
         """
@@ -175,6 +424,7 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
         Only activates when entering a control (fieldType starts with "start_"),
         not when exiting ("end_"). Gets the role from attrs dict and the
         screen location from the object at the virtual caret position.
+        With syncWithSpeech, the sound plays when the field is spoken.
 
         Args:
             attrs: Dictionary of control field attributes (role, states, etc.)
@@ -184,53 +434,69 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
             extraDetail: Whether extra detail is requested
             reason: Why the speech is being generated
         """
+        if self._terminated:
+            return self._original_getControlFieldSpeech(
+                attrs, ancestorAttrs, fieldType, formatConfig, extraDetail, reason
+            )
+        cfg = get_config_snapshot()
+        earcon = None
         try:
             if (
-                self.is_enabled()
-                and get_config("browseModeSound")
+                cfg.enabled
+                and cfg.browseModeSound
                 and isinstance(fieldType, str)
                 and fieldType == "start_addedToControlFieldStack"
             ):
                 role = attrs.get("role")
                 if role is not None and role in ROLE_SOUND_MAP:
-                    states = attrs.get("states", set()) or set()
-                    level = attrs.get("level", None)
-                    # Create a lightweight object for get_sounds_for_object
-                    elem = types.SimpleNamespace(role=role, states=states, level=level)
-                    sound_filenames = get_sounds_for_object(elem)
+                    key = get_sound_key(role, attrs.get("states"), attrs.get("level"))
+                    plan = self.sound_player.get_plan(key)
 
-                    if sound_filenames:
+                    if plan:
                         # Get object at caret for 3D positioning
-                        obj = self._get_browse_mode_object()
+                        obj = self.browse_locator.get_object(attrs, ancestorAttrs)
                         if obj is not None:
-                            self.sound_player.play_for_object(obj, sound_filenames)
+                            utterance = self.browse_locator.utterance
+                            if cfg.syncWithSpeech:
+                                earcon = (obj, plan, utterance)
+                            else:
+                                self.sound_player.play_for_object(obj, plan, utterance)
         except Exception:
-            pass
+            earcon = None
 
-        return self._original_getControlFieldSpeech(
+        sequence = self._original_getControlFieldSpeech(
             attrs, ancestorAttrs, fieldType, formatConfig, extraDetail, reason
         )
+        if earcon is not None:
+            self._attach_earcon(sequence, *earcon)
+        return sequence
 
-    def _get_browse_mode_object(self):
+    def _attach_earcon(self, sequence, obj, plan, utterance=None):
         """
-        Get the NVDA object at the current browse mode caret position.
+        Make an earcon play when speech reaches the start of a sequence.
 
-        Used for 3D audio positioning when navigating in browse mode.
-        The caret position is already updated when getControlFieldSpeech
-        is called, so this returns the correct object.
+        Inserts a PlayEarconCommand at the start of the speech sequence
+        generated for an object or control field, so nothing plays for
+        speech that is cancelled before it is spoken. The earcon keeps the
+        navigation it was generated for. Sequences that can't be modified
+        play the earcon immediately instead.
 
-        Returns:
-            NVDA object at caret, or None if unavailable
+        Args:
+            sequence: Speech sequence returned by the original function
+            obj: NVDA object used to position the earcon
+            plan: Tuple of sounds from SoundPlayer.get_plan()
+            utterance: Browse mode utterance number, or None
         """
         try:
-            focus = api.getFocusObject()
-            ti = getattr(focus, 'treeInterceptor', None)
-            if ti is None:
-                return None
-            info = ti.makeTextInfo(textInfos.POSITION_CARET)
-            return info.NVDAObjectAtStart
+            if isinstance(sequence, list):
+                sequence.insert(0, PlayEarconCommand(
+                    self.sound_player.play_for_object, obj, plan, utterance=utterance,
+                    navigation=self.sound_player.navigation,
+                ))
+                return
+            self.sound_player.play_for_object(obj, plan, utterance)
         except Exception:
-            return None
+            pass
 
     def play_for_object(self, obj):
         """
@@ -241,9 +507,51 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
         """
         if not self.is_enabled():
             return
-        sound_filenames = get_sounds_for_object(obj)
-        if sound_filenames:
-            self.sound_player.play_for_object(obj, sound_filenames)
+        plan = self.sound_player.get_plan(get_sound_key_for_object(obj))
+        if plan:
+            self.sound_player.play_for_object(obj, plan)
+
+    def _fire_early(self, obj):
+        """
+        Play the earcon of an object from an event, before its speech.
+
+        Leaves a token so the getObjectPropertiesSpeech hook doesn't play it
+        again when NVDA generates the object's speech. The event has already
+        started a navigation, so the earcons of the speech that follows
+        (e.g. the focus ancestors) don't supersede this one.
+
+        Args:
+            obj: NVDA object to play sounds for
+        """
+        try:
+            plan = self.sound_player.get_plan(get_sound_key_for_object(obj))
+            if plan:
+                self.sound_player.play_for_object(obj, plan)
+                self._early_fire_token = (obj, time.perf_counter())
+                self.early_fired += 1
+        except Exception:
+            pass
+
+    def _consume_early_fire_token(self, obj):
+        """
+        Check whether an event already played the earcon of an object.
+
+        Args:
+            obj: NVDA object whose speech is being generated
+
+        Returns:
+            True if the earcon was fired early and must not play again
+        """
+        token = self._early_fire_token
+        if token is None or token[0] is not obj:
+            return False
+        self._early_fire_token = None
+        lead_time = time.perf_counter() - token[1]
+        if lead_time > EARLY_FIRE_TOKEN_TTL:
+            return False
+        self.early_matched += 1
+        self.early_lead_time += lead_time
+        return True
 
     # ===== Event Handlers =====
 
@@ -251,13 +559,21 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
         """
         Handle focus changes (keyboard navigation with Tab, arrows, etc.).
 
-        Sound is NOT played here — it is triggered by the
+        Sound is normally NOT played here — it is triggered by the
         getObjectPropertiesSpeech hook to ensure perfect synchronization.
+        With earlyFire, it is played here, before NVDA fetches the
+        properties it speaks. Every focus change starts a navigation, also
+        when no gesture caused it.
 
         Args:
             obj: The object that gained focus
             nextHandler: Function to call to propagate the event
         """
+        self.sound_player.begin_navigation()
+        cfg = get_config_snapshot()
+        if cfg.enabled and cfg.earlyFire:
+            self._fire_early(obj)
+        self.browse_locator.release_closed_document()
         # CRITICAL: Always call nextHandler to propagate the event.
         # The sound will be triggered by _hook_getObjectPropertiesSpeech
         # when NVDA generates speech for this object.
@@ -267,14 +583,22 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
         """
         Handle NVDA object navigation (NVDA+numpad arrows).
 
-        Sound is NOT played here — it is triggered by the
+        Sound is normally NOT played here — it is triggered by the
         getObjectPropertiesSpeech hook to ensure perfect synchronization.
+        With earlyFire, it is played here (unless the object also gained
+        focus, which event_gainFocus handles). Like a focus change, moving
+        the navigator object starts a navigation.
 
         Args:
             obj: The object that became the navigator object
             nextHandler: Function to call to propagate the event
             isFocus: True if this object also has focus
         """
+        if not isFocus:
+            self.sound_player.begin_navigation()
+        cfg = get_config_snapshot()
+        if cfg.enabled and cfg.earlyFire and not isFocus:
+            self._fire_early(obj)
         # CRITICAL: Always call nextHandler to propagate the event.
         nextHandler()
 
@@ -293,6 +617,7 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
         """
         enabled = get_config("enabled")
         set_config("enabled", not enabled)
+        refresh_config_snapshot()
 
         if not enabled:
             # Was disabled, now enabled
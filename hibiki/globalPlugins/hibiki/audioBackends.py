@@ -0,0 +1,310 @@
+# audioBackends.py - Audio engines that SoundPlayer can play through
+# Part of Hibiki add-on for NVDA
+#
+# A backend loads sound buffers and creates voices that play them:
+#
+#   backend.start()                        initialize the engine
+#   backend.load_buffer(path, decoded, stream)
+#                                          load a sound, returns a buffer
+#   backend.create_voice(buffer)           create a voice playing a buffer
+#   backend.free_buffer(buffer)            release a buffer
+#   backend.play_batch(entries)            play (voice, x, y, z) entries
+#   backend.terminate()                    shut the engine down
+#
+# Voices provide set_position(x, y, z), set_volume(gain), play(),
+# play_at(x, y, z) (set_position then play), stop(), get_length() (seconds,
+# 0 if unknown) and free().
+#
+# backend.needs_pcm tells whether load_buffer() works from decoded audio;
+# SoundPlayer only decodes sounds in Python for such backends, since other
+# engines read the files themselves.
+#
+# Every method is called from the audio thread only.
+
+import abc
+import time
+from collections import deque
+
+
+class AudioBackend(abc.ABC):
+    """
+    Base class of audio backends; see the module comment for the protocol.
+
+    Backends must implement load_buffer() and create_voice(); one that
+    doesn't can't be instantiated.
+    """
+
+    # Name used to select the backend (see create_backend)
+    name = None
+
+    # Whether load_buffer() uses decoded audio (see the module comment)
+    needs_pcm = False
+
+    def start(self):
+        """
+        Initialize the engine.
+
+        Raises:
+            Exception if the engine can't be started
+        """
+
+    @abc.abstractmethod
+    def load_buffer(self, path, decoded=None, stream=False):
+        """
+        Load a sound.
+
+        Args:
+            path: Absolute path of the sound file
+            decoded: DecodedSound already read from the file, if any
+            stream: Whether to stream the file from disk when played rather
+                than load it whole (a hint backends may ignore)
+
+        Returns:
+            Buffer to pass to create_voice
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def create_voice(self, buffer):
+        """
+        Create a voice playing a sound.
+
+        Args:
+            buffer: Buffer returned by load_buffer
+
+        Returns:
+            Voice object
+        """
+        raise NotImplementedError
+
+    def free_buffer(self, buffer):
+        """
+        Release a buffer whose voices have all been freed.
+
+        Args:
+            buffer: Buffer returned by load_buffer
+        """
+
+    def play_batch(self, entries):
+        """
+        Position and play several voices.
+
+        Args:
+            entries: List of (voice, x, y, z)
+
+        Returns:
+            Number of voices that failed to play
+        """
+        failed = 0
+        for voice, x, y, z in entries:
+            try:
+                voice.play_at(x, y, z)
+            except Exception:
+                failed += 1
+        return failed
+
+    def terminate(self):
+        """Shut the engine down."""
+
+
+class _StreamedPath(str):
+    """Path of a sound that CamlornBackend streams from disk."""
+
+    __slots__ = ()
+
+
+class CamlornBackend(AudioBackend):
+    """
+    3D audio through camlorn_audio (OpenAL Soft with HRTF).
+
+    camlorn_audio loads its DLLs when imported, so it is only imported by
+    start(). It creates every source from a file, so buffers are file paths.
+    The engine is initialized once per process, even if the backend is
+    switched away from and back to. Voices are played through the lean
+    bindings of camlornBindings rather than camlorn_audio's methods.
+    Streamed sounds play through StreamingSound3D, which reads the file as
+    it plays instead of holding all of it in memory.
+    """
+
+    name = "camlorn"
+
+    # Whether camlorn_audio has been initialized in this process
+    _engine_started = False
+
+    def __init__(self):
+        self._Sound3D = None
+        self._StreamingSound3D = None
+        self._bindings = None
+
+    def start(self):
+        from .camlorn_audio import init_camlorn_audio, Sound3D, StreamingSound3D
+        from . import camlornBindings
+        if not CamlornBackend._engine_started:
+            init_camlorn_audio()
+            CamlornBackend._engine_started = True
+        camlornBindings.load()
+        self._Sound3D = Sound3D
+        self._StreamingSound3D = StreamingSound3D
+        self._bindings = camlornBindings
+
+    def load_buffer(self, path, decoded=None, stream=False):
+        return _StreamedPath(path) if stream else path
+
+    def create_voice(self, buffer):
+        if isinstance(buffer, _StreamedPath):
+            voice = self._StreamingSound3D(buffer)
+        else:
+            voice = self._Sound3D(buffer)
+        # Set rolloff_factor to 0 to disable volume falloff with distance
+        # This ensures consistent volume regardless of position
+        voice.set_rolloff_factor(0)
+        return self._bindings.CamlornVoice(voice)
+
+    def play_batch(self, entries):
+        return self._bindings.play_batch(entries)
+
+
+class NullVoice(object):
+    """Voice that plays nothing."""
+
+    __slots__ = ("buffer",)
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def set_position(self, x, y, z):
+        pass
+
+    def set_volume(self, gain):
+        pass
+
+    def play(self):
+        pass
+
+    def play_at(self, x, y, z):
+        pass
+
+    def stop(self):
+        pass
+
+    def get_length(self):
+        return 0.0
+
+    def free(self):
+        pass
+
+
+class NullBackend(AudioBackend):
+    """
+    Backend that plays nothing.
+
+    Lets the playback path run without an audio device, e.g. to profile it.
+    """
+
+    name = "null"
+
+    def load_buffer(self, path, decoded=None, stream=False):
+        return path
+
+    def create_voice(self, buffer):
+        return NullVoice(buffer)
+
+
+class RecordingVoice(NullVoice):
+    """Voice that records its calls in its backend's log."""
+
+    __slots__ = ("_record",)
+
+    def __init__(self, buffer, record):
+        super().__init__(buffer)
+        self._record = record
+
+    def set_position(self, x, y, z):
+        self._record("set_position", self.buffer, x, y, z)
+
+    def set_volume(self, gain):
+        self._record("set_volume", self.buffer, gain)
+
+    def play(self):
+        self._record("play", self.buffer)
+
+    def play_at(self, x, y, z):
+        self._record("play_at", self.buffer, x, y, z)
+
+    def stop(self):
+        self._record("stop", self.buffer)
+
+    def free(self):
+        self._record("free", self.buffer)
+
+
+class RecordingBackend(AudioBackend):
+    """
+    Backend that plays nothing and logs every call with a timestamp.
+
+    Entries are (time.perf_counter(), call name, *arguments), so they can be
+    compared with the queue time of PlayCommands to measure latency.
+    """
+
+    name = "recording"
+
+    def __init__(self, max_entries=10000):
+        """
+        Args:
+            max_entries: Number of most recent calls kept
+        """
+        self.log = deque(maxlen=max_entries)
+
+    def _record(self, call, *args):
+        self.log.append((time.perf_counter(), call) + args)
+
+    def start(self):
+        self._record("start")
+
+    def load_buffer(self, path, decoded=None, stream=False):
+        self._record("load_buffer", path, stream)
+        return path
+
+    def create_voice(self, buffer):
+        self._record("create_voice", buffer)
+        return RecordingVoice(buffer, self._record)
+
+    def free_buffer(self, buffer):
+        self._record("free_buffer", buffer)
+
+    def play_batch(self, entries):
+        self._record("play_batch", len(entries))
+        return super().play_batch(entries)
+
+    def terminate(self):
+        self._record("terminate")
+
+
+def _create_stereo_backend():
+    # Imported here, as stereoBackend builds on this module
+    from .stereoBackend import StereoBackend
+    return StereoBackend()
+
+
+# Callables creating each backend, by name
+BACKENDS = {
+    backend.name: backend
+    for backend in (CamlornBackend, NullBackend, RecordingBackend)
+}
+BACKENDS["stereo"] = _create_stereo_backend
+
+
+def create_backend(name):
+    """
+    Create an audio backend by name.
+
+    Args:
+        name: One of the names in BACKENDS
+
+    Returns:
+        AudioBackend instance
+
+    Raises:
+        KeyError if there is no such backend
+    """
+    return BACKENDS[name]()
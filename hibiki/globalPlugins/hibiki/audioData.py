@@ -0,0 +1,185 @@
+# audioData.py - Reading and decoding of sound files
+# Part of Hibiki add-on for NVDA
+
+import os
+import time
+import wave
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+# Maximum number of threads decoding sound files at the same time
+DECODE_WORKERS = min(4, os.cpu_count() or 1)
+
+
+class DecodedSound(object):
+    """
+    PCM audio decoded from a sound file.
+
+    data holds interleaved little-endian integer samples, as stored in a
+    WAV file.
+    """
+
+    __slots__ = ("path", "rate", "channels", "sample_width", "frames", "data")
+
+    def __init__(self, path, rate, channels, sample_width, frames, data):
+        """
+        Args:
+            path: Path of the source file
+            rate: Sample rate in Hz
+            channels: Number of channels
+            sample_width: Bytes per sample
+            frames: Number of frames
+            data: bytes of PCM data
+        """
+        self.path = path
+        self.rate = rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.frames = frames
+        self.data = data
+
+    @property
+    def duration(self):
+        """Length of the sound in seconds."""
+        return float(self.frames) / self.rate if self.rate else 0.0
+
+
+def decode_wav(path):
+    """
+    Read and decode a PCM WAV file.
+
+    Args:
+        path: Path of the WAV file
+
+    Returns:
+        DecodedSound
+
+    Raises:
+        wave.Error, EOFError or OSError if the file can't be read
+    """
+    with wave.open(path, 'rb') as wav:
+        frames = wav.getnframes()
+        return DecodedSound(
+            path,
+            wav.getframerate(),
+            wav.getnchannels(),
+            wav.getsampwidth(),
+            frames,
+            wav.readframes(frames),
+        )
+
+
+def to_pcm16_mono(decoded):
+    """
+    Convert decoded audio to 16-bit mono samples.
+
+    Multi-channel audio is downmixed by averaging the channels.
+
+    Args:
+        decoded: DecodedSound with 8, 16, 24 or 32-bit integer samples
+
+    Returns:
+        array('h') of mono samples
+
+    Raises:
+        ValueError if the sample width is not supported
+    """
+    width = decoded.sample_width
+    data = bytes(decoded.data)
+    if width == 2:
+        samples = array('h', data)
+    elif width == 1:
+        # 8-bit WAV samples are unsigned
+        samples = array('h', ((value - 128) << 8 for value in data))
+    elif width == 3:
+        samples = array('h', (
+            int.from_bytes(data[index + 1:index + 3], 'little', signed=True)
+            for index in range(0, len(data) - 2, 3)
+        ))
+    elif width == 4:
+        samples = array('h', (value >> 16 for value in array('i', data)))
+    else:
+        raise ValueError("Unsupported sample width: %d" % width)
+
+    channels = decoded.channels
+    if channels > 1:
+        samples = array('h', (
+            sum(samples[index:index + channels]) // channels
+            for index in range(0, len(samples) - channels + 1, channels)
+        ))
+    return samples
+
+
+def mix_pcm16(parts):
+    """
+    Mix 16-bit mono samples, clipping the result.
+
+    Args:
+        parts: Iterable of (array('h') of samples, offset in frames)
+
+    Returns:
+        array('h') of mixed samples, as long as the longest part
+    """
+    parts = list(parts)
+    length = max([len(samples) + offset for samples, offset in parts] or [0])
+    mixed = [0] * length
+    for samples, offset in parts:
+        for index, value in enumerate(samples, offset):
+            mixed[index] += value
+    return array('h', (min(32767, max(-32768, value)) for value in mixed))
+
+
+def write_wav(path, rate, samples):
+    """
+    Write 16-bit mono samples to a WAV file.
+
+    Args:
+        path: Path of the WAV file to write
+        rate: Sample rate in Hz
+        samples: array('h') of samples
+    """
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(samples.tobytes())
+
+
+def _timed_decode(path):
+    """
+    Decode a WAV file, measuring how long it takes.
+
+    Args:
+        path: Path of the WAV file
+
+    Returns:
+        tuple (DecodedSound or None if it can't be decoded, seconds)
+    """
+    start = time.perf_counter()
+    try:
+        decoded = decode_wav(path)
+    except Exception:
+        decoded = None
+    return decoded, time.perf_counter() - start
+
+
+def start_decoding(paths, max_workers=DECODE_WORKERS):
+    """
+    Decode WAV files in parallel on a thread pool.
+
+    File reads release the GIL, so several files are read at once.
+    The pool shuts itself down once every file has been decoded.
+
+    Args:
+        paths: Iterable of WAV file paths
+        max_workers: Number of decoding threads
+
+    Returns:
+        List of futures, in the order of paths, each resolving to
+        (DecodedSound or None, seconds spent decoding)
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="HibikiDecode")
+    try:
+        return [executor.submit(_timed_decode, path) for path in paths]
+    finally:
+        executor.shutdown(wait=False)
@@ -0,0 +1,159 @@
+# browseModeLocator.py - Resolves the object used to position browse mode sounds
+# Part of Hibiki add-on for NVDA
+
+import time
+from collections import OrderedDict
+import api
+import textInfos
+import treeInterceptorHandler
+
+# Maximum number of caret positions remembered for the current document
+CARET_CACHE_SIZE = 128
+
+# Seconds after which a remembered caret position is resolved again, since
+# dynamic pages can re-render and move content between offsets
+CARET_CACHE_TTL = 10.0
+
+
+class BrowseModeLocator(object):
+    """
+    Finds the NVDA object at the browse mode caret for 3D positioning.
+
+    Resolving the object at the caret requires a caret TextInfo and an
+    NVDAObject creation. When one line enters several nested control fields
+    (e.g. list > list item > link), getControlFieldSpeech is called once per
+    field, so the object is resolved once per utterance and shared by every
+    nested field: NVDA passes each field's ancestors as a list that contains
+    the very same attrs dicts it passed for the outer fields.
+
+    Each utterance gets a number (utterance), shared by its nested fields,
+    so their earcons can be scheduled together.
+
+    Objects are also remembered per caret position in the current document,
+    so returning to a position (e.g. with quick navigation keys) doesn't
+    create the NVDAObject again. Call release_closed_document() when the
+    focus moves and clear() on shutdown, so a closed document isn't kept
+    alive by the cache.
+    """
+
+    def __init__(self):
+        # Last resolved field of the current utterance: (treeInterceptor, attrs, obj)
+        self._last_field = None
+        # Current document and its caret position -> (obj, time) cache
+        self._document = None
+        self._caret_cache = OrderedDict()
+        # Number of the current utterance
+        self.utterance = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_object(self, attrs, ancestorAttrs):
+        """
+        Get the NVDA object at the browse mode caret for a control field.
+
+        Updates utterance: it only stays the same for a nested field of the
+        previous field's utterance.
+
+        Args:
+            attrs: Attributes of the control field being entered
+            ancestorAttrs: Attributes of its ancestor control fields
+
+        Returns:
+            NVDA object at caret, or None if unavailable
+        """
+        try:
+            focus = api.getFocusObject()
+            ti = getattr(focus, 'treeInterceptor', None)
+            if ti is None:
+                return None
+
+            # Nested field of the same utterance: reuse the object
+            last_field = self._last_field
+            if last_field is not None and last_field[0] is ti and ancestorAttrs:
+                last_attrs = last_field[1]
+                for ancestor in ancestorAttrs:
+                    if ancestor is last_attrs:
+                        self._last_field = (ti, attrs, last_field[2])
+                        self.hits += 1
+                        return last_field[2]
+
+            self.utterance += 1
+            obj = self._get_object_at_caret(ti)
+            self._last_field = (ti, attrs, obj) if obj is not None else None
+            return obj
+        except Exception:
+            return None
+
+    def _get_object_at_caret(self, ti):
+        """
+        Get the object at the caret, using the per-document cache.
+
+        Args:
+            ti: Tree interceptor of the current document
+
+        Returns:
+            NVDA object at caret, or None if unavailable
+        """
+        if ti is not self._document:
+            self._document = ti
+            self._caret_cache.clear()
+
+        info = ti.makeTextInfo(textInfos.POSITION_CARET)
+        try:
+            key = _get_bookmark_key(info.bookmark)
+        except Exception:
+            key = None
+
+        now = time.monotonic()
+        cache = self._caret_cache
+        if key is not None:
+            entry = cache.get(key)
+            if entry is not None and now - entry[1] < CARET_CACHE_TTL:
+                cache.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        self.misses += 1
+        obj = info.NVDAObjectAtStart
+        if key is not None and obj is not None:
+            cache[key] = (obj, now)
+            cache.move_to_end(key)
+            if len(cache) > CARET_CACHE_SIZE:
+                cache.popitem(last=False)
+        return obj
+
+    def release_closed_document(self):
+        """Forget the cached objects if their document has been closed."""
+        document = self._document
+        if document is not None and document not in treeInterceptorHandler.runningTable:
+            self.clear()
+
+    def clear(self):
+        """Forget every cached object."""
+        self._last_field = None
+        self._document = None
+        self._caret_cache.clear()
+
+
+def _get_bookmark_key(bookmark):
+    """
+    Get a hashable key identifying a caret bookmark.
+
+    Offset bookmarks (textInfos.offsets.Offsets) define __eq__ without
+    __hash__, so they can't be used as keys themselves.
+
+    Args:
+        bookmark: Bookmark of a TextInfo
+
+    Returns:
+        Hashable key, or None if the bookmark can't be identified
+    """
+    try:
+        return (bookmark.startOffset, bookmark.endOffset)
+    except AttributeError:
+        pass
+    try:
+        hash(bookmark)
+    except TypeError:
+        return None
+    return bookmark
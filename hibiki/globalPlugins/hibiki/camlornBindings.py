@@ -0,0 +1,191 @@
+# camlornBindings.py - Lean ctypes bindings for the calls made per earcon
+# Part of Hibiki add-on for NVDA
+
+import time
+from ctypes import c_double, c_float, c_int, c_void_p
+
+# Bound functions, set by load()
+_set_position = None
+_set_volume = None
+_play = None
+_stop = None
+_get_length = None
+_error_classes = None
+
+
+def _bind(library, name, restype, *argtypes):
+    """
+    Get a function of a DLL with its argument and result types declared.
+
+    Args:
+        library: ctypes.CDLL
+        name: Name of the exported function
+        restype: ctypes result type
+        *argtypes: ctypes argument types
+
+    Returns:
+        ctypes function pointer
+    """
+    # Indexing (unlike attribute access) returns a new function object, so
+    # the declarations don't leak to other users of the library object
+    function = library[name]
+    function.restype = restype
+    function.argtypes = argtypes
+    return function
+
+
+def load():
+    """
+    Bind the functions used by CamlornVoice.
+
+    camlorn_audio loads its DLLs when imported, so this is only called
+    once the engine is being started.
+    """
+    global _set_position, _set_volume, _play, _stop, _get_length, _error_classes
+    from .camlorn_audio import _camlorn_audio, _error_code_to_class
+    library = _camlorn_audio.ca_module
+    _set_position = _bind(
+        library, "CA_SourceHelper3D_setPosition", c_int, c_void_p, c_float, c_float, c_float,
+    )
+    _set_volume = _bind(library, "CA_SoundBase_setVolume", c_int, c_void_p, c_float)
+    _play = _bind(library, "CA_SoundBase_play", c_int, c_void_p)
+    _stop = _bind(library, "CA_SoundBase_stop", c_int, c_void_p)
+    _get_length = _bind(library, "CA_SoundBase_getLength", c_double, c_void_p)
+    _error_classes = _error_code_to_class
+
+
+def _raise(code):
+    """
+    Raise the camlorn_audio exception of an error code.
+
+    Args:
+        code: Non-zero result of a camlorn_audio function
+    """
+    raise _error_classes[code](code)
+
+
+class CamlornVoice(object):
+    """
+    Voice playing a camlorn_audio Sound3D through the lean bindings.
+
+    camlorn_audio's own methods go through camcall, which checks the handle
+    and converts every argument again on each call. This keeps the handle
+    as a c_void_p and calls the bound functions directly. The Sound3D still
+    owns the handle and is only used to free it.
+    """
+
+    __slots__ = ("sound", "_handle")
+
+    def __init__(self, sound):
+        """
+        Args:
+            sound: camlorn_audio Sound3D, with its file set
+        """
+        self.sound = sound
+        self._handle = c_void_p(sound.handle)
+
+    def set_position(self, x, y, z):
+        code = _set_position(self._handle, x, y, z)
+        if code:
+            _raise(code)
+
+    def set_volume(self, gain):
+        code = _set_volume(self._handle, gain)
+        if code:
+            _raise(code)
+
+    def play(self):
+        code = _play(self._handle)
+        if code:
+            _raise(code)
+
+    def play_at(self, x, y, z):
+        handle = self._handle
+        code = _set_position(handle, x, y, z) or _play(handle)
+        if code:
+            _raise(code)
+
+    def stop(self):
+        if self._handle is None:
+            return
+        code = _stop(self._handle)
+        if code:
+            _raise(code)
+
+    def get_length(self):
+        return _get_length(self._handle)
+
+    def free(self):
+        # Forget the handle, so a voice still queued in a batch is skipped
+        # by play_batch instead of being played after it was freed
+        self._handle = None
+        self.sound.free()
+
+
+def play_batch(entries):
+    """
+    Position and play several voices.
+
+    Voices freed since they were queued are skipped.
+
+    Args:
+        entries: Iterable of (CamlornVoice, x, y, z)
+
+    Returns:
+        Number of voices that failed to play
+    """
+    set_position = _set_position
+    play = _play
+    failed = 0
+    for voice, x, y, z in entries:
+        handle = voice._handle
+        if handle is None or set_position(handle, x, y, z) or play(handle):
+            failed += 1
+    return failed
+
+
+def benchmark(path, iterations=2000):
+    """
+    Measure the Python and FFI cost of playing one earcon.
+
+    Compares camlorn_audio's methods (set_position, then play) with
+    CamlornVoice.play_at and with play_batch. The voice is muted. Meant to
+    be run from NVDA's Python console once Hibiki has started the engine,
+    e.g. with the path of one of the add-on's sounds.
+
+    Args:
+        path: Path of a sound file
+        iterations: Number of earcons per measurement
+
+    Returns:
+        dict mapping "camcall", "playAt" and "batch" to microseconds per earcon
+    """
+    from .camlorn_audio import Sound3D
+    if _play is None:
+        load()
+    sound = Sound3D(path)
+    try:
+        sound.set_volume(0.0)
+        voice = CamlornVoice(sound)
+        results = {}
+
+        start = time.perf_counter()
+        for index in range(iterations):
+            sound.set_position(float(index % 50 - 25), 0.0, -5.0)
+            sound.play()
+        results["camcall"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for index in range(iterations):
+            voice.play_at(float(index % 50 - 25), 0.0, -5.0)
+        results["playAt"] = time.perf_counter() - start
+
+        entries = [(voice, float(index % 50 - 25), 0.0, -5.0) for index in range(iterations)]
+        start = time.perf_counter()
+        play_batch(entries)
+        results["batch"] = time.perf_counter() - start
+
+        sound.stop()
+    finally:
+        sound.free()
+    return {name: elapsed / iterations * 1e6 for name, elapsed in results.items()}
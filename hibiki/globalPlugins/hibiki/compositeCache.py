@@ -0,0 +1,264 @@
+# compositeCache.py - Pre-mixed sounds for role and state combinations
+# Part of Hibiki add-on for NVDA
+
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .audioData import DecodedSound, decode_wav, mix_pcm16, to_pcm16_mono, write_wav
+from .voicePool import PooledSound
+
+# Maximum bytes of mixed PCM kept loaded
+COMPOSITE_CACHE_BYTES = 2 * 1024 * 1024
+
+# Seconds by which state sounds start after the role sound in a composite
+STATE_SOUND_OFFSET = 0.0
+
+# Longest sound, in seconds, mixed into a composite; combinations with a
+# longer sound play separately
+COMPOSITE_MAX_DURATION = 1.0
+
+
+class CompositeCache(object):
+    """
+    LRU cache of sounds mixed from the sounds of one earcon.
+
+    A checked checkbox plays a role and a state sound; played separately,
+    each needs its own voice and its own position and play calls. The
+    sounds of such a combination are mixed once into a composite sound,
+    which then plays on one voice.
+
+    Only the sounds of one plan (a role and its states) are mixed. A
+    composite is built the first time its combination is played: decoding
+    (for sounds the sound bank doesn't have), mixing and writing it run on
+    a background thread, and the sounds play separately until it is ready.
+    The audio engine only loads sounds from files, so composites are
+    written as WAV files to a temporary directory that close() removes.
+    Custom sounds, sounds longer than max_duration and combinations whose
+    mix would exceed max_bytes are never mixed: they play separately, so
+    the custom sound budget and streaming still apply to them. When the
+    mixed PCM exceeds max_bytes, the least recently used composites are
+    freed. Apart from the building, only used by the audio thread.
+    """
+
+    def __init__(self, sounds_directory, load_sound, free_sound, get_pcm,
+            max_bytes=COMPOSITE_CACHE_BYTES, state_offset=STATE_SOUND_OFFSET,
+            max_duration=COMPOSITE_MAX_DURATION):
+        """
+        Args:
+            sounds_directory: Directory of the default sounds; sounds from
+                elsewhere (custom sounds) are never mixed
+            load_sound: Callable taking (PooledSound, DecodedSound) that loads
+                a sound into the engine
+            free_sound: Callable taking a PooledSound that stops and frees
+                its voices and buffer
+            get_pcm: Callable taking a PooledSound that returns its
+                DecodedSound without decoding it (from the sound bank), or
+                None
+            max_bytes: Maximum bytes of mixed PCM kept loaded
+            state_offset: Seconds by which state sounds are delayed
+            max_duration: Longest sound in seconds that is mixed
+        """
+        self.sounds_directory = sounds_directory
+        self._load_sound = load_sound
+        self._free_sound = free_sound
+        self._get_pcm = get_pcm
+        self.max_bytes = max_bytes
+        self.state_offset = state_offset
+        self.max_duration = max_duration
+        # Composite key -> (PooledSound, bytes of PCM)
+        self._composites = OrderedDict()
+        self._size = 0
+        self._directory = None
+        # Composite key -> Future of a composite being built
+        self._building = {}
+        # Keys of combinations that can't be mixed
+        self._unmixable = set()
+        # Single thread building composites, created on the first miss
+        self._builder = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, commands):
+        """
+        Get the composite sound playing the sounds of several commands.
+
+        On a miss, the composite is built in the background and None is
+        returned; a later call returns it once it is ready.
+
+        Args:
+            commands: PlayCommands of one plan, with the same position
+
+        Returns:
+            Loaded PooledSound, or None if it isn't built yet or the sounds
+            aren't mixed (custom or long sounds, a mix larger than
+            max_bytes, sounds that can't be decoded or have different sample
+            rates)
+        """
+        key = tuple((command.sound.path, command.priority[0] > 0) for command in commands)
+        entry = self._composites.get(key)
+        if entry is not None:
+            self._composites.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        if key in self._unmixable:
+            return None
+
+        future = self._building.get(key)
+        if future is None:
+            if any(os.path.dirname(path) != self.sounds_directory for path, _is_state in key):
+                self._unmixable.add(key)
+                return None
+            self.misses += 1
+            if self._builder is None:
+                self._builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="HibikiComposite")
+            # Sounds already decoded while loading or found in the sound
+            # bank are reused; the others are decoded by the builder
+            sounds = []
+            for command in commands:
+                pcm = command.sound.pcm
+                if pcm is None:
+                    pcm = self._get_pcm(command.sound)
+                sounds.append((command.sound.path, pcm))
+            self._building[key] = self._builder.submit(self._build, key, sounds, self.misses)
+            return None
+        if not future.done():
+            return None
+
+        del self._building[key]
+        built = future.result()
+        if built is None:
+            self._unmixable.add(key)
+            return None
+        path, rate, samples = built
+        composite = PooledSound(path)
+        self._load_sound(composite, DecodedSound(path, rate, 1, 2, len(samples), samples))
+        if composite.failed:
+            self._remove_file(path)
+            self._unmixable.add(key)
+            return None
+
+        size = len(samples) * 2
+        self._composites[key] = (composite, size)
+        self._size += size
+        self._evict()
+        return composite
+
+    def _build(self, key, sounds, number):
+        """
+        Mix the sounds of a combination and write them to a WAV file.
+
+        Runs on the builder thread.
+
+        Args:
+            key: Composite key, telling which sounds are state sounds
+            sounds: List of (path, DecodedSound or None if not decoded yet)
+            number: Number making the file name unique
+
+        Returns:
+            tuple (path, sample rate, array('h') of samples), or None if
+            the sounds aren't mixed
+        """
+        try:
+            decoded = [pcm if pcm is not None else decode_wav(path) for path, pcm in sounds]
+            rate = decoded[0].rate
+            if any(sound.rate != rate for sound in decoded):
+                return None
+            if any(sound.frames > self.max_duration * rate for sound in decoded):
+                return None
+            offset = int(self.state_offset * rate)
+            frames = max(
+                sound.frames + (offset if is_state else 0)
+                for sound, (_path, is_state) in zip(decoded, key)
+            )
+            if frames * 2 > self.max_bytes:
+                return None
+            samples = mix_pcm16(
+                (to_pcm16_mono(sound), offset if is_state else 0)
+                for sound, (_path, is_state) in zip(decoded, key)
+            )
+            path = os.path.join(self._get_directory(), "composite%d.wav" % (number,))
+            write_wav(path, rate, samples)
+        except Exception:
+            return None
+        return path, rate, samples
+
+    def _get_directory(self):
+        """
+        Get the directory holding the composite WAV files, creating it.
+
+        Returns:
+            Path of the directory
+        """
+        if self._directory is None:
+            self._directory = tempfile.mkdtemp(prefix="hibiki")
+        return self._directory
+
+    def _evict(self):
+        """Free the least recently used composites until under max_bytes."""
+        while self._size > self.max_bytes and len(self._composites) > 1:
+            _key, (composite, size) = self._composites.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            self._free(composite)
+
+    def _free(self, composite):
+        """
+        Free the voices of a composite and delete its file.
+
+        Args:
+            composite: PooledSound to free
+        """
+        self._free_sound(composite)
+        composite.failed = True
+        self._remove_file(composite.path)
+
+    def _remove_file(self, path):
+        """
+        Delete a composite file, ignoring errors.
+
+        Args:
+            path: Path of the file
+        """
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def close(self):
+        """
+        Stop building, free every composite and remove the temporary
+        directory.
+        """
+        if self._builder is not None:
+            for future in self._building.values():
+                future.cancel()
+            self._builder.shutdown(wait=True)
+            self._builder = None
+        self._building.clear()
+        while self._composites:
+            _key, (composite, _size) = self._composites.popitem()
+            self._free(composite)
+        self._size = 0
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+
+    def get_stats(self):
+        """
+        Get cache statistics for diagnostics.
+
+        Returns:
+            dict with hits, misses, evictions, size in bytes, entry count
+            and number of composites being built
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "bytes": self._size,
+            "size": len(self._composites),
+            "building": len(self._building),
+        }
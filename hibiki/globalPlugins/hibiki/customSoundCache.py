@@ -0,0 +1,116 @@
+# customSoundCache.py - Memory budget for custom sounds
+# Part of Hibiki add-on for NVDA
+
+from collections import OrderedDict
+
+# Maximum bytes of custom sound audio kept loaded
+CUSTOM_SOUND_BUDGET_BYTES = 4 * 1024 * 1024
+
+# Custom sound files larger than this are streamed from disk instead of
+# being loaded whole (about 11 seconds of 44.1 kHz 16-bit mono)
+STREAMING_THRESHOLD_BYTES = 1024 * 1024
+
+
+class CustomSoundCache(object):
+    """
+    LRU budget of the memory held by loaded custom sounds.
+
+    Default sounds are short and always loaded, but a custom sound can be
+    any WAV file the user picked. Custom sounds larger than
+    streaming_threshold are streamed from disk, so they hold little memory;
+    the others are loaded whole and counted against max_bytes. When the
+    budget is exceeded, the least recently played custom sounds are freed,
+    releasing their engine objects right away. A freed sound stays known to
+    SoundPlayer and is loaded again the next time it plays.
+
+    Sizes are file sizes, which for WAV files is close to the PCM they load
+    to. Only used by the audio thread.
+    """
+
+    def __init__(self, free_sound, max_bytes=CUSTOM_SOUND_BUDGET_BYTES,
+            streaming_threshold=STREAMING_THRESHOLD_BYTES):
+        """
+        Args:
+            free_sound: Callable taking a PooledSound that stops and frees
+                its voices and buffer
+            max_bytes: Maximum bytes of custom sounds kept loaded
+            streaming_threshold: Size in bytes above which files are streamed
+        """
+        self._free_sound = free_sound
+        self.max_bytes = max_bytes
+        self.streaming_threshold = streaming_threshold
+        # PooledSound -> bytes counted against the budget, least recent first
+        self._sounds = OrderedDict()
+        self._size = 0
+        self.streamed = 0
+        self.evictions = 0
+
+    def should_stream(self, size):
+        """
+        Check whether a custom sound file should be streamed.
+
+        Args:
+            size: Size of the file in bytes
+
+        Returns:
+            True if the file should be streamed rather than loaded whole
+        """
+        return size > self.streaming_threshold
+
+    def add(self, sound, size, streamed=False):
+        """
+        Record a custom sound that was just loaded, evicting others if needed.
+
+        Args:
+            sound: Loaded PooledSound
+            size: Size of its file in bytes
+            streamed: Whether it was loaded as a stream
+        """
+        if streamed:
+            self.streamed += 1
+            size = 0
+        previous = self._sounds.pop(sound, None)
+        if previous is not None:
+            self._size -= previous
+        self._sounds[sound] = size
+        self._size += size
+        self._evict()
+
+    def touch(self, sound):
+        """
+        Mark a sound as just played.
+
+        Args:
+            sound: PooledSound about to play (custom or not)
+        """
+        if sound in self._sounds:
+            self._sounds.move_to_end(sound)
+
+    def _evict(self):
+        """Free the least recently played sounds until under max_bytes."""
+        while self._size > self.max_bytes and len(self._sounds) > 1:
+            sound, size = self._sounds.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            self._free_sound(sound)
+
+    def clear(self):
+        """Free every custom sound."""
+        while self._sounds:
+            sound, _size = self._sounds.popitem()
+            self._free_sound(sound)
+        self._size = 0
+
+    def get_stats(self):
+        """
+        Get cache statistics for diagnostics.
+
+        Returns:
+            dict with resident bytes, loaded sounds, streamed loads and evictions
+        """
+        return {
+            "bytes": self._size,
+            "size": len(self._sounds),
+            "streamed": self.streamed,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,72 @@
+# duplicateFilter.py - Suppresses repeated earcons for the same control
+# Part of Hibiki add-on for NVDA
+
+import time
+from collections import deque
+
+# Seconds during which the same earcon for the same control isn't repeated
+DUPLICATE_WINDOW = 0.15
+
+# Number of recent earcons remembered
+DUPLICATE_HISTORY = 8
+
+
+class DuplicateFilter(object):
+    """
+    Remembers recently played earcons so one logical event plays once.
+
+    NVDA may generate speech for the same object several times during one
+    focus change (e.g. re-announcements), and in browse mode both speech
+    hooks can fire for the same control through different NVDAObject
+    instances. An earcon is a duplicate if the same plan played within
+    the window for the same object, or for a control with the same window
+    handle and location.
+    """
+
+    def __init__(self, window=DUPLICATE_WINDOW, size=DUPLICATE_HISTORY):
+        """
+        Args:
+            window: Seconds during which an earcon isn't repeated
+            size: Number of recent earcons remembered
+        """
+        self.window = window
+        # Recent earcons as (time, obj, plan, key)
+        self._recent = deque(maxlen=size)
+        self.suppressed = 0
+
+    def is_duplicate(self, obj, plan, key=None):
+        """
+        Check whether an earcon was just played for the same control.
+
+        Args:
+            obj: NVDA object the earcon is for
+            plan: Tuple of sounds of the earcon
+            key: (windowHandle, location) of the control, or None to only
+                compare objects
+
+        Returns:
+            True if the earcon must not play again
+        """
+        now = time.perf_counter()
+        for played, recent_obj, recent_plan, recent_key in self._recent:
+            if now - played >= self.window or recent_plan != plan:
+                continue
+            if recent_obj is obj or (key is not None and recent_key == key):
+                self.suppressed += 1
+                return True
+        return False
+
+    def add(self, obj, plan, key=None):
+        """
+        Remember an earcon that is being played.
+
+        Args:
+            obj: NVDA object the earcon is for
+            plan: Tuple of sounds of the earcon
+            key: (windowHandle, location) of the control, or None
+        """
+        self._recent.append((time.perf_counter(), obj, plan, key))
+
+    def clear(self):
+        """Forget every recent earcon."""
+        self._recent.clear()
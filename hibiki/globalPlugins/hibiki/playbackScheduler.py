@@ -0,0 +1,175 @@
+# playbackScheduler.py - Coalesces bursts of playback requests
+# Part of Hibiki add-on for NVDA
+
+# Default seconds within which a newer navigation supersedes an older one
+COALESCE_WINDOW = 0.1
+
+# Default maximum number of voices a single navigation event may play
+EVENT_VOICE_BUDGET = 4
+
+# Seconds the audio thread waits for the other fields of a browse mode
+# utterance before playing it, so the budget can pick among all of them
+UTTERANCE_GATHER_TIME = 0.01
+
+
+class PlaybackScheduler(object):
+    """
+    Latest-wins scheduling of earcons on the audio thread.
+
+    Every navigation event (one object or control field announced) queues
+    the sounds of its earcon as PlayCommands sharing an event number. The
+    events queued for one navigation (one gesture or focus change, see
+    SoundPlayer.begin_navigation) share a navigation number: a focus change
+    announces the focus ancestors and the focus, and a browse mode line may
+    enter several sibling fields, and all of them play. While a key is held
+    down, navigations arrive faster than their earcons play, and NVDA
+    cancels most of their speech. Within the coalescing window:
+
+    - queued commands of an older navigation are dropped when a newer
+      navigation is already waiting behind them, and
+    - when a newer navigation starts playing, the voices still playing the
+      previous navigation's earcons are stopped.
+
+    Navigations further apart than the window play normally. A window of 0
+    disables coalescing.
+
+    Each event also has a voice budget. In browse mode, all control fields
+    entered by one utterance (e.g. list > list item > link) form one event,
+    so entering a deeply nested structure doesn't start a role and state
+    sound for every field at once. Sounds are chosen by their priority:
+    role sounds before state sounds, inner fields before outer ones. The
+    remaining sounds are dropped.
+    """
+
+    def __init__(self, window=COALESCE_WINDOW, voice_budget=EVENT_VOICE_BUDGET):
+        """
+        Args:
+            window: Coalescing window in seconds
+            voice_budget: Maximum number of voices per event
+        """
+        self.window = window
+        self.voice_budget = max(1, voice_budget)
+        # Event currently playing, its navigation, when its first command
+        # was queued, and the voices playing the navigation's recent events
+        self._event = None
+        self._navigation = None
+        self._event_time = 0.0
+        self._voices = []
+        # Commands of the current event started or skipped so far
+        self._event_commands = 0
+        self.played = 0
+        self.dropped = 0
+        self.superseded = 0
+        self.over_budget = 0
+
+    def coalesce(self, commands):
+        """
+        Drop the queued commands of superseded navigations.
+
+        Args:
+            commands: List of PlayCommands taken from the queue, oldest first
+
+        Returns:
+            List of PlayCommands to execute, oldest first
+        """
+        window = self.window
+        if window <= 0 or len(commands) < 2:
+            return commands
+        latest = commands[-1]
+        kept = []
+        dropped = set()
+        for command in commands:
+            if command.navigation != latest.navigation and latest.time - command.time < window:
+                dropped.add(command.event)
+            else:
+                kept.append(command)
+        # An event whose earlier commands already started isn't counted twice
+        dropped.discard(self._event)
+        self.dropped += len(dropped)
+        return kept
+
+    def apply_budget(self, commands):
+        """
+        Keep the highest priority commands of each event within its budget.
+
+        Args:
+            commands: List of PlayCommands to execute, oldest first
+
+        Returns:
+            List of PlayCommands to execute, oldest first
+        """
+        budget = self.voice_budget
+        by_event = {}
+        for command in commands:
+            by_event.setdefault(command.event, []).append(command)
+        if all(len(group) <= budget for group in by_event.values()) and self._event not in by_event:
+            return commands
+
+        allowed = set()
+        for event, group in by_event.items():
+            remaining = budget
+            if event == self._event:
+                remaining -= self._event_commands
+            if remaining >= len(group):
+                allowed.update(id(command) for command in group)
+                continue
+            group.sort(key=lambda command: command.priority)
+            chosen = group[:max(0, remaining)]
+            allowed.update(id(command) for command in chosen)
+            self.over_budget += len(group) - len(chosen)
+        return [command for command in commands if id(command) in allowed]
+
+    def start(self, command):
+        """
+        Record that a command is about to play.
+
+        Args:
+            command: PlayCommand to execute
+
+        Returns:
+            List of voices of a superseded navigation to stop (possibly
+            empty)
+        """
+        if command.event == self._event:
+            self._event_commands += 1
+            return []
+        superseded = []
+        within_window = self.window > 0 and command.time - self._event_time < self.window
+        if command.navigation != self._navigation:
+            if self._voices and within_window:
+                superseded = self._voices
+                self.superseded += 1
+            self._navigation = command.navigation
+            self._voices = []
+        elif not within_window:
+            # Earlier events of this navigation can't be superseded anymore
+            self._voices = []
+        self._event = command.event
+        self._event_time = command.time
+        self._event_commands = 1
+        self.played += 1
+        return superseded
+
+    def add_voice(self, voice):
+        """
+        Record a voice playing the current navigation.
+
+        Args:
+            voice: Voice object that started playing
+        """
+        self._voices.append(voice)
+
+    def get_stats(self):
+        """
+        Get event counters for diagnostics.
+
+        Returns:
+            dict with played, dropped and superseded event counts, and the
+            number of sounds dropped by the voice budget
+        """
+        return {
+            "played": self.played,
+            "dropped": self.dropped,
+            "superseded": self.superseded,
+            "overBudget": self.over_budget,
+        }
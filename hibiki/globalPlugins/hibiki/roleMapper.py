@@ -154,52 +154,185 @@ STATE_SOUND_MAP = {get_state_constant(k): v[0] for k, v in _STATE_DEFINITIONS.it
 STATE_TO_CONTROL_KEY = {get_state_constant(k): v[1] for k, v in _STATE_DEFINITIONS.items()}
 
 
-def get_sounds_for_object(obj):
+# Bit assigned to each state Hibiki has a sound for. Used to build compact
+# (role, states bitmask, level) keys for the earcon plan memo in SoundPlayer.
+_STATE_ORDER = tuple(STATE_SOUND_MAP)
+_STATE_BITS = {state: 1 << index for index, state in enumerate(_STATE_ORDER)}
+
+# Normalized heading level for both int (focus mode) and str (browse mode) values
+_HEADING_LEVEL_KEYS = {}
+for _level in _HEADING_LEVEL_SOUNDS:
+    _HEADING_LEVEL_KEYS[_level] = _level
+    _HEADING_LEVEL_KEYS[str(_level)] = _level
+
+# Resolution table: the final sound (default file or custom path) for every
+# role, heading level and state, with the user's custom sounds already applied.
+# Rebuilt by rebuild_sound_table() whenever the customization or the active
+# config profile changes, so the speech hooks only do dictionary lookups.
+_resolved_role_sounds = {}
+_resolved_heading_sounds = {}
+_resolved_state_sounds = {}
+
+# Incremented on every rebuild so caches derived from the table can detect
+# that they are stale.
+_table_generation = 0
+
+
+def rebuild_sound_table(custom_sounds):
     """
-    Get list of sound filenames or paths to play for a given NVDA object.
+    Rebuild the role/heading level/state resolution table.
+
+    Each table is built in full and then swapped in with a single assignment,
+    so concurrent speech hooks always see a complete table.
 
     Args:
-        obj: NVDA object to get sounds for
+        custom_sounds: dict mapping control key to custom sound path
+    """
+    global _resolved_role_sounds, _resolved_heading_sounds, _resolved_state_sounds
+    global _table_generation
+
+    role_sounds = {}
+    for role, sound_file in ROLE_SOUND_MAP.items():
+        control_key = ROLE_TO_CONTROL_KEY.get(role)
+        role_sounds[role] = custom_sounds.get(control_key) or sound_file
+
+    heading_sounds = {}
+    for level, sound_file in _HEADING_LEVEL_SOUNDS.items():
+        heading_sounds[level] = custom_sounds.get('heading{}'.format(level)) or sound_file
+
+    state_sounds = {}
+    for state, sound_file in STATE_SOUND_MAP.items():
+        control_key = STATE_TO_CONTROL_KEY.get(state)
+        state_sounds[state] = custom_sounds.get(control_key) or sound_file
+
+    _resolved_role_sounds = role_sounds
+    _resolved_heading_sounds = heading_sounds
+    _resolved_state_sounds = state_sounds
+    _table_generation += 1
+
+
+# Start with the default sounds until the configuration is loaded
+rebuild_sound_table({})
+
+
+def get_table_generation():
+    """
+    Get the generation number of the current resolution table.
+
+    Returns:
+        int that changes every time the table is rebuilt
+    """
+    return _table_generation
+
+
+def _normalize_heading_level(level):
+    """
+    Convert a heading level to an int in 1–6.
+
+    Args:
+        level: Heading level as int, str, or None
+
+    Returns:
+        int level, or None if the level has no dedicated sound
+    """
+    normalized = _HEADING_LEVEL_KEYS.get(level)
+    if normalized is None and level is not None:
+        try:
+            normalized = _HEADING_LEVEL_KEYS.get(int(level))
+        except (TypeError, ValueError):
+            pass
+    return normalized
+
+
+def get_sound_key(role, states, level=None):
+    """
+    Build a compact, hashable key describing which sounds an object needs.
+
+    Only states Hibiki has sounds for contribute to the bitmask, and the level
+    is only kept for the generic HEADING role, so objects that sound the same
+    share a key.
+
+    Args:
+        role: Role constant of the object
+        states: Iterable of state constants, or None
+        level: Heading level (int or str), or None
+
+    Returns:
+        tuple (role, states_bitmask, level)
+    """
+    mask = 0
+    if states:
+        state_bits = _STATE_BITS
+        for state in states:
+            bit = state_bits.get(state)
+            if bit:
+                mask |= bit
+    if role == _HEADING_ROLE_CONSTANT:
+        level = _normalize_heading_level(level)
+    else:
+        level = None
+    return (role, mask, level)
+
+
+def get_sounds_for_key(key):
+    """
+    Get list of sound filenames or paths to play for a key from get_sound_key().
+
+    Only reads the prebuilt resolution table; no config or JSON access.
+
+    Args:
+        key: tuple (role, states_bitmask, level)
 
     Returns:
         List of sound filenames/paths (strings) to play
     """
+    role, mask, level = key
     sounds = []
-    from .soundCustomizationDialog import get_custom_sounds
-    custom_sounds = get_custom_sounds()
-
-    # Get sound for the object's role
-    if hasattr(obj, 'role') and obj.role in ROLE_SOUND_MAP:
-        control_key = ROLE_TO_CONTROL_KEY.get(obj.role)
-        sound_file = ROLE_SOUND_MAP[obj.role]
-
-        # For the generic HEADING role (modern NVDA), resolve the level-specific
-        # control key and sound. The level can be an int (focus mode) or a string
-        # (browse mode virtual buffer attrs), so we always convert via int().
-        if obj.role == _HEADING_ROLE_CONSTANT:
-            try:
-                level = int(getattr(obj, 'level', None))
-                if level in _HEADING_LEVEL_SOUNDS:
-                    control_key = 'heading{}'.format(level)
-                    sound_file = _HEADING_LEVEL_SOUNDS[level]
-            except (TypeError, ValueError):
-                pass
-
-        if control_key and control_key in custom_sounds:
-            sounds.append(custom_sounds[control_key])
-        else:
-            sounds.append(sound_file)
-
-    # Get sounds for the object's states
-    if hasattr(obj, 'states'):
-        for state in obj.states:
-            if state in STATE_SOUND_MAP:
-                # Check for custom sound first
-                control_key = STATE_TO_CONTROL_KEY.get(state)
-                if control_key and control_key in custom_sounds:
-                    sounds.append(custom_sounds[control_key])
-                else:
-                    sounds.append(STATE_SOUND_MAP[state])
+
+    # Get sound for the role. For the generic HEADING role (modern NVDA),
+    # the level-specific sound takes precedence.
+    sound = _resolved_role_sounds.get(role)
+    if sound is not None:
+        if level is not None:
+            sound = _resolved_heading_sounds.get(level, sound)
+        sounds.append(sound)
+
+    # Get sounds for the states, in definition order
+    if mask:
+        state_sounds = _resolved_state_sounds
+        for index, state in enumerate(_STATE_ORDER):
+            if mask & (1 << index):
+                sounds.append(state_sounds[state])
 
     return sounds
 
+
+def get_sound_key_for_object(obj):
+    """
+    Build the get_sound_key() key for an NVDA object or attribute namespace.
+
+    The level is only read for the generic HEADING role, since fetching it
+    from other objects can be a cross-process call.
+
+    Args:
+        obj: NVDA object (or object with role/states/level attributes)
+
+    Returns:
+        tuple (role, states_bitmask, level)
+    """
+    role = getattr(obj, 'role', None)
+    level = getattr(obj, 'level', None) if role == _HEADING_ROLE_CONSTANT else None
+    return get_sound_key(role, getattr(obj, 'states', None), level)
+
+
+def get_sounds_for_object(obj):
+    """
+    Get list of sound filenames or paths to play for a given NVDA object.
+
+    Args:
+        obj: NVDA object to get sounds for
+
+    Returns:
+        List of sound filenames/paths (strings) to play
+    """
+    return get_sounds_for_key(get_sound_key_for_object(obj))
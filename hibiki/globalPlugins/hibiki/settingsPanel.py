@@ -1,12 +1,15 @@
 # settingsPanel.py - Configuration GUI panel
 # Part of Hibiki add-on for NVDA
 
+import types
 import config
+import extensionPoints
 import gui
-from gui import guiHelper
+from gui import guiHelper, nvdaControls
 from gui.settingsDialogs import SettingsPanel
 import wx
 import addonHandler
+from .roleMapper import rebuild_sound_table
 
 addonHandler.initTranslation()
 
@@ -26,6 +29,10 @@ def init_configuration():
         "suppressStateLabels": "boolean(default=True)",
         "browseModeSound": "boolean(default=True)",
         "customSounds": "string(default={})",
+        "coalesceWindow": "integer(default=100, min=0, max=1000)",
+        "syncWithSpeech": "boolean(default=False)",
+        "earlyFire": "boolean(default=False)",
+        "audioBackend": 'option("camlorn", "stereo", default="camlorn")',
     }
     config.conf.spec[Hibiki_CONFIG_KEY] = confspec
 
@@ -50,6 +57,115 @@ def set_config(key, value):
         value: Value to set
     """
     config.conf[Hibiki_CONFIG_KEY][key] = value
+    if key == "customSounds":
+        refresh_config_snapshot()
+
+class HibikiConfig(object):
+    """
+    Immutable snapshot of the Hibiki configuration.
+
+    The speech hooks run for every announcement, so they read this snapshot
+    through a single module-level reference instead of going through
+    config.conf's profile aggregation on every call. A new snapshot is built
+    and swapped in by refresh_config_snapshot(); existing snapshots are never
+    modified. customSounds is a read-only mapping, so it can't be changed
+    through a snapshot either.
+    """
+
+    __slots__ = (
+        "enabled",
+        "suppressRoleLabels",
+        "suppressStateLabels",
+        "browseModeSound",
+        "customSounds",
+        "coalesceWindow",
+        "syncWithSpeech",
+        "earlyFire",
+        "audioBackend",
+    )
+
+    def __init__(self, enabled=True, suppressRoleLabels=True, suppressStateLabels=True,
+            browseModeSound=True, customSounds=None, coalesceWindow=100,
+            syncWithSpeech=False, earlyFire=False, audioBackend="camlorn"):
+        """
+        Args:
+            enabled: Whether Hibiki is enabled
+            suppressRoleLabels: Whether spoken role labels are removed
+            suppressStateLabels: Whether spoken state labels are removed
+            browseModeSound: Whether sounds play in browse mode
+            customSounds: dict mapping control key to custom sound path
+            coalesceWindow: Milliseconds within which a newer navigation
+                (gesture or focus change) supersedes the earcons of an older
+                one (0 disables)
+            syncWithSpeech: Whether sounds play when their speech is spoken
+                rather than when it is generated
+            earlyFire: Whether focus and navigator events play sounds
+                before NVDA generates the speech
+            audioBackend: Name of the audio backend sounds play through
+                ("camlorn" for 3D audio, "stereo" for stereo panning)
+        """
+        object.__setattr__(self, "enabled", enabled)
+        object.__setattr__(self, "suppressRoleLabels", suppressRoleLabels)
+        object.__setattr__(self, "suppressStateLabels", suppressStateLabels)
+        object.__setattr__(self, "browseModeSound", browseModeSound)
+        object.__setattr__(self, "customSounds", types.MappingProxyType(dict(customSounds or {})))
+        object.__setattr__(self, "coalesceWindow", coalesceWindow)
+        object.__setattr__(self, "syncWithSpeech", syncWithSpeech)
+        object.__setattr__(self, "earlyFire", earlyFire)
+        object.__setattr__(self, "audioBackend", audioBackend)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("HibikiConfig snapshots are immutable")
+
+    @classmethod
+    def from_config(cls):
+        """
+        Build a snapshot from the currently active configuration profile.
+
+        Returns:
+            HibikiConfig instance
+        """
+        from .soundCustomizationDialog import get_custom_sounds
+        return cls(
+            enabled=get_config("enabled"),
+            suppressRoleLabels=get_config("suppressRoleLabels"),
+            suppressStateLabels=get_config("suppressStateLabels"),
+            browseModeSound=get_config("browseModeSound"),
+            customSounds=get_custom_sounds(),
+            coalesceWindow=get_config("coalesceWindow"),
+            syncWithSpeech=get_config("syncWithSpeech"),
+            earlyFire=get_config("earlyFire"),
+            audioBackend=get_config("audioBackend"),
+        )
+
+# Current configuration snapshot, replaced as a whole by refresh_config_snapshot()
+_config_snapshot = HibikiConfig()
+
+# Notifies after a new configuration snapshot has been swapped in.
+# Handlers receive the new snapshot as the snapshot keyword argument.
+post_configSnapshotChange = extensionPoints.Action()
+
+def get_config_snapshot():
+    """
+    Get the current configuration snapshot.
+
+    Returns:
+        HibikiConfig instance
+    """
+    return _config_snapshot
+
+def refresh_config_snapshot():
+    """
+    Rebuild the configuration snapshot and the sound resolution table.
+
+    Called at startup, after settings are saved, when Hibiki is toggled,
+    when custom sounds change and when the config profile switches.
+    """
+    global _config_snapshot
+    snapshot = HibikiConfig.from_config()
+    rebuild_sound_table(snapshot.customSounds)
+    _config_snapshot = snapshot
+    post_configSnapshotChange.notify(snapshot=snapshot)
 
 class HibikiSettingsPanel(SettingsPanel):
     """
@@ -116,6 +232,71 @@ class HibikiSettingsPanel(SettingsPanel):
               "and quick navigation keys (H, K, B, etc.) in browse mode.")
         ))
 
+        # Checkbox to play sounds when speech reaches them
+        # Translators: Label for checkbox to synchronize sounds with speech output
+        self.syncWithSpeechCheckbox = sHelper.addItem(
+            wx.CheckBox(self, label=_("Play sounds when the &speech is spoken"))
+        )
+        self.syncWithSpeechCheckbox.SetValue(get_config("syncWithSpeech"))
+
+        # Translators: Tooltip for the synchronize with speech checkbox
+        self.syncWithSpeechCheckbox.SetToolTip(wx.ToolTip(
+            _("When enabled, a sound plays when the synthesizer reaches the item it belongs to, "
+              "and no sound plays for speech that is interrupted before that. "
+              "Sounds then also depend on speech being on.")
+        ))
+
+        # Checkbox to play sounds as soon as the focus moves
+        # Translators: Label for checkbox to play sounds as soon as focus or the navigator object moves
+        self.earlyFireCheckbox = sHelper.addItem(
+            wx.CheckBox(self, label=_("Play sounds as soon as the &focus moves (lower latency)"))
+        )
+        self.earlyFireCheckbox.SetValue(get_config("earlyFire"))
+
+        # Translators: Tooltip for the early fire checkbox
+        self.earlyFireCheckbox.SetToolTip(wx.ToolTip(
+            _("When enabled, the sound of a control plays when the focus or navigator object moves to it, "
+              "without waiting for NVDA to prepare its speech.")
+        ))
+
+        # Spin control for the coalescing window
+        # Translators: Label for the setting that drops earcons of quickly superseded items
+        self.coalesceWindowSpin = sHelper.addLabeledControl(
+            _("Skip earcons of items passed within (&milliseconds, 0 to play all):"),
+            nvdaControls.SelectOnFocusSpinCtrl,
+            min=0,
+            max=1000,
+            initial=get_config("coalesceWindow"),
+        )
+
+        # Translators: Tooltip for the coalescing window setting
+        self.coalesceWindowSpin.SetToolTip(wx.ToolTip(
+            _("When moving quickly (e.g. holding an arrow key), an earcon is cut short or skipped "
+              "if the next item is reached within this time, so only the latest item is heard.")
+        ))
+
+        # Choice of the audio backend
+        self._audioBackends = ("camlorn", "stereo")
+        # Translators: Label for the choice of how sounds are positioned
+        self.audioBackendChoice = sHelper.addLabeledControl(
+            _("Sound &positioning:"),
+            wx.Choice,
+            choices=[
+                # Translators: Audio backend positioning sounds in 3D
+                _("3D audio (HRTF)"),
+                # Translators: Audio backend panning sounds between left and right
+                _("Stereo panning (NVDA audio output)"),
+            ],
+        )
+        self.audioBackendChoice.SetSelection(self._audioBackends.index(get_config("audioBackend")))
+
+        # Translators: Tooltip for the choice of how sounds are positioned
+        self.audioBackendChoice.SetToolTip(wx.ToolTip(
+            _("3D audio also places sounds above and below you, but needs its own audio engine. "
+              "Stereo panning only places sounds left and right, and plays them through "
+              "the audio output device selected in NVDA.")
+        ))
+
         # Button to open sound customization dialog
         # Translators: Button to open sound customization dialog
         self.customizeSoundsBtn = sHelper.addItem(
@@ -148,3 +329,8 @@ class HibikiSettingsPanel(SettingsPanel):
         set_config("suppressRoleLabels", self.suppressRoleLabelsCheckbox.GetValue())
         set_config("suppressStateLabels", self.suppressStateLabelsCheckbox.GetValue())
         set_config("browseModeSound", self.browseModeSoundCheckbox.GetValue())
+        set_config("coalesceWindow", self.coalesceWindowSpin.GetValue())
+        set_config("syncWithSpeech", self.syncWithSpeechCheckbox.GetValue())
+        set_config("earlyFire", self.earlyFireCheckbox.GetValue())
+        set_config("audioBackend", self._audioBackends[self.audioBackendChoice.GetSelection()])
+        refresh_config_snapshot()
@@ -0,0 +1,46 @@
+# soundAssets.py - Aliases between default sound files
+# Part of Hibiki add-on for NVDA
+#
+# This module only uses the standard library, so build_addon.py can import
+# it. The build ships a single copy of sound files with identical content
+# and writes an alias manifest mapping the names of the dropped copies to
+# the shipped file.
+
+import json
+import os
+
+# Name of the alias manifest in the sounds directory
+ALIASES_FILENAME = "aliases.json"
+
+
+def load_aliases(sounds_directory):
+    """
+    Read the alias manifest of a sounds directory.
+
+    Args:
+        sounds_directory: Path to the directory containing the default sounds
+
+    Returns:
+        dict mapping alias filename to shipped filename (empty if the
+        directory has no manifest, e.g. when running from source)
+    """
+    try:
+        with open(os.path.join(sounds_directory, ALIASES_FILENAME), "r", encoding="utf-8") as manifest:
+            aliases = json.load(manifest)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(aliases, dict):
+        return {}
+    return aliases
+
+
+def write_aliases(path, aliases):
+    """
+    Write an alias manifest.
+
+    Args:
+        path: Path of the manifest file to write
+        aliases: dict mapping alias filename to shipped filename
+    """
+    with open(path, "w", encoding="utf-8") as manifest:
+        json.dump(aliases, manifest, indent=1, sort_keys=True)
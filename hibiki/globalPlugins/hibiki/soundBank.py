@@ -0,0 +1,169 @@
+# soundBank.py - Pre-decoded sound bank file
+# Part of Hibiki add-on for NVDA
+#
+# This module only uses the standard library, so build_addon.py can import
+# it to write the bank that the add-on reads at runtime.
+#
+# File layout (all integers little-endian):
+#   header:  magic (4 bytes), version (uint16), reserved (uint16), entry count (uint32)
+#   index:   one entry per sound:
+#            key (64 bytes, UTF-8, NUL padded), data offset (uint32),
+#            frames (uint32), sample rate (uint32), channels (uint16),
+#            bits per sample (uint16)
+#   data:    contiguous 16-bit PCM for all sounds; offsets are from the
+#            start of the file. Identical sounds share the same data.
+
+import mmap
+import struct
+
+# Name of the bank file in the sounds directory
+BANK_FILENAME = "sounds.bank"
+
+BANK_MAGIC = b"HBNK"
+BANK_VERSION = 1
+
+_HEADER = struct.Struct("<4sHHI")
+_ENTRY = struct.Struct("<64sIIIHH")
+_KEY_SIZE = 64
+
+
+class BankEntry(object):
+    """Location and format of one sound in a bank."""
+
+    __slots__ = ("key", "offset", "frames", "rate", "channels", "bits")
+
+    def __init__(self, key, offset, frames, rate, channels, bits):
+        self.key = key
+        self.offset = offset
+        self.frames = frames
+        self.rate = rate
+        self.channels = channels
+        self.bits = bits
+
+    @property
+    def size(self):
+        """Size of the PCM data in bytes."""
+        return self.frames * self.channels * (self.bits // 8)
+
+
+def write_bank(path, sounds):
+    """
+    Write a sound bank file.
+
+    Args:
+        path: Path of the bank file to write
+        sounds: Iterable of (key, rate, pcm) with pcm as bytes of 16-bit
+            mono samples
+
+    Returns:
+        tuple (number of entries, bytes of PCM data written)
+    """
+    sounds = list(sounds)
+    data_start = _HEADER.size + _ENTRY.size * len(sounds)
+    index = []
+    blobs = []
+    offsets_by_data = {}
+    offset = data_start
+    for key, rate, pcm in sounds:
+        encoded_key = key.encode("utf-8")
+        if len(encoded_key) > _KEY_SIZE:
+            raise ValueError("Sound bank key too long: %s" % key)
+        pcm = bytes(pcm)
+        data_offset = offsets_by_data.get(pcm)
+        if data_offset is None:
+            data_offset = offset
+            offsets_by_data[pcm] = data_offset
+            blobs.append(pcm)
+            offset += len(pcm)
+        index.append(_ENTRY.pack(encoded_key, data_offset, len(pcm) // 2, rate, 1, 16))
+
+    with open(path, "wb") as bank:
+        bank.write(_HEADER.pack(BANK_MAGIC, BANK_VERSION, 0, len(index)))
+        for entry in index:
+            bank.write(entry)
+        for pcm in blobs:
+            bank.write(pcm)
+    return len(index), offset - data_start
+
+
+class SoundBank(object):
+    """
+    Read-only, memory-mapped sound bank.
+
+    Opening a bank maps the whole file and parses its index; PCM data is
+    returned as memoryview slices of the mapping, so nothing is copied.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: Path of the bank file
+
+        Raises:
+            OSError if the file can't be opened, ValueError if it isn't a
+            valid bank
+        """
+        self.path = path
+        with open(path, "rb") as bank:
+            self._map = mmap.mmap(bank.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._view = memoryview(self._map)
+            self.entries = self._read_index()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_index(self):
+        """
+        Parse the bank index.
+
+        Returns:
+            dict mapping key to BankEntry
+        """
+        if len(self._map) < _HEADER.size:
+            raise ValueError("Sound bank is truncated")
+        magic, version, _reserved, count = _HEADER.unpack_from(self._map, 0)
+        if magic != BANK_MAGIC or version != BANK_VERSION:
+            raise ValueError("Unsupported sound bank format")
+        entries = {}
+        position = _HEADER.size
+        for _index in range(count):
+            key, offset, frames, rate, channels, bits = _ENTRY.unpack_from(self._map, position)
+            position += _ENTRY.size
+            entry = BankEntry(key.rstrip(b"\0").decode("utf-8"), offset, frames, rate, channels, bits)
+            if entry.offset + entry.size > len(self._map):
+                raise ValueError("Sound bank entry out of range: %s" % entry.key)
+            entries[entry.key] = entry
+        return entries
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get_pcm(self, key):
+        """
+        Get the PCM data of a sound without copying it.
+
+        Args:
+            key: Sound key (file name)
+
+        Returns:
+            tuple (BankEntry, memoryview of the PCM data), or None if the
+            bank has no such sound
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        return entry, self._view[entry.offset:entry.offset + entry.size]
+
+    def close(self):
+        """
+        Unmap the bank.
+
+        Fails silently while memoryviews of the data are still referenced;
+        the mapping is then released when they are.
+        """
+        try:
+            self._view.release()
+            self._map.close()
+        except (AttributeError, BufferError):
+            pass
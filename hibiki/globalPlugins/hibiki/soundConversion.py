@@ -0,0 +1,303 @@
+# soundConversion.py - Conversion of custom sounds to the engine's format
+# Part of Hibiki add-on for NVDA
+
+import hashlib
+import os
+import threading
+from array import array
+from .audioData import decode_wav, to_pcm16_mono, write_wav
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Sample rate the audio engine mixes at (see camlorn_audio.init_camlorn_audio)
+ENGINE_RATE = 44100
+
+# Absolute 16-bit sample value at or below which audio counts as silence
+# (about -54 dBFS)
+SILENCE_LEVEL = 64
+
+# Seconds of audio kept after the last sound above SILENCE_LEVEL, so fading
+# tails aren't cut abruptly
+TRIM_TAIL_PADDING = 0.01
+
+# Peak level of normalized sounds, as a fraction of full scale (about -1 dBFS)
+PEAK_TARGET = 0.89
+
+# Name of the converted sound cache directory in NVDA's user config directory
+CACHE_DIRECTORY_NAME = "hibikiSounds"
+
+# Bumped whenever the conversion changes, so older cache entries aren't reused
+CONVERSION_VERSION = 1
+
+# Length of the content hash in cache file names
+_DIGEST_LENGTH = 16
+
+# Held while a sound is converted, so prune_cache() never removes a file
+# being written
+_conversion_lock = threading.Lock()
+
+
+def resample(samples, rate, target_rate):
+    """
+    Resample 16-bit mono samples by linear interpolation.
+
+    Args:
+        samples: array('h') of samples
+        rate: Sample rate of samples in Hz
+        target_rate: Sample rate to convert to in Hz
+
+    Returns:
+        array('h') of samples at target_rate
+    """
+    if rate == target_rate or not samples:
+        return samples
+    count = max(1, int(len(samples) * target_rate // rate))
+    step = float(rate) / target_rate
+    if numpy is not None:
+        source = numpy.frombuffer(samples.tobytes(), dtype=numpy.int16)
+        positions = numpy.arange(count) * step
+        resampled = numpy.interp(positions, numpy.arange(len(source)), source)
+        return array('h', resampled.astype(numpy.int16).tobytes())
+    last = len(samples) - 1
+    resampled = array('h', bytes(count * 2))
+    for index in range(count):
+        position = index * step
+        before = int(position)
+        if before >= last:
+            resampled[index] = samples[last]
+            continue
+        first = samples[before]
+        resampled[index] = int(first + (samples[before + 1] - first) * (position - before))
+    return resampled
+
+
+def trim_silence(samples, rate, level=SILENCE_LEVEL, tail_padding=TRIM_TAIL_PADDING):
+    """
+    Remove leading and trailing silence.
+
+    Leading silence is removed entirely, so the sound starts as soon as it
+    is played; tail_padding seconds are kept after the end.
+
+    Args:
+        samples: array('h') of 16-bit mono samples
+        rate: Sample rate in Hz
+        level: Absolute sample value at or below which audio is silence
+        tail_padding: Seconds kept after the last sound
+
+    Returns:
+        array('h') of samples (unchanged if it is all silence)
+    """
+    start = next((index for index, value in enumerate(samples) if abs(value) > level), None)
+    if start is None:
+        return samples
+    end = next(index for index in range(len(samples) - 1, start - 1, -1) if abs(samples[index]) > level)
+    end = min(len(samples), end + 1 + int(tail_padding * rate))
+    return samples[start:end]
+
+
+def normalize_peak(samples, target=PEAK_TARGET):
+    """
+    Scale samples so their peak reaches a target level.
+
+    Args:
+        samples: array('h') of 16-bit samples
+        target: Peak level as a fraction of full scale
+
+    Returns:
+        array('h') of samples (unchanged if it is all silence)
+    """
+    peak = max((abs(value) for value in samples), default=0)
+    if not peak:
+        return samples
+    scale = target * 32767 / peak
+    if numpy is not None:
+        source = numpy.frombuffer(samples.tobytes(), dtype=numpy.int16)
+        scaled = numpy.clip(numpy.round(source * scale), -32768, 32767)
+        return array('h', scaled.astype(numpy.int16).tobytes())
+    return array('h', (max(-32768, min(32767, int(round(value * scale)))) for value in samples))
+
+
+def convert_sound(path, target_rate=ENGINE_RATE):
+    """
+    Convert a WAV file to trimmed, normalized mono at the engine's rate.
+
+    Args:
+        path: Path of the WAV file
+        target_rate: Sample rate to convert to in Hz
+
+    Returns:
+        array('h') of 16-bit mono samples at target_rate
+
+    Raises:
+        wave.Error, EOFError, OSError or ValueError if the file can't be read
+    """
+    decoded = decode_wav(path)
+    samples = resample(to_pcm16_mono(decoded), decoded.rate, target_rate)
+    return normalize_peak(trim_silence(samples, target_rate))
+
+
+def get_cache_directory():
+    """
+    Get the directory of converted sounds in NVDA's user config directory.
+
+    Returns:
+        Path of the directory (not created)
+    """
+    import globalVars
+    return os.path.join(globalVars.appArgs.configPath, CACHE_DIRECTORY_NAME)
+
+
+def hash_file(path):
+    """
+    Get the hash identifying a file's content and the conversion applied.
+
+    Args:
+        path: Path of the file
+
+    Returns:
+        Hexadecimal digest
+
+    Raises:
+        OSError if the file can't be read
+    """
+    digest = hashlib.sha256(b"hibiki-conversion-%d:" % CONVERSION_VERSION)
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:_DIGEST_LENGTH]
+
+
+def get_converted_path(path, cache_directory=None):
+    """
+    Get the converted version of a sound file, converting it if needed.
+
+    Converted files are named after the source file and its content hash,
+    so converting the same file again reuses the earlier result, and a
+    changed file is converted anew. Conversion takes seconds for long
+    files without NumPy, so this is called from a background thread.
+
+    Args:
+        path: Path of the WAV file
+        cache_directory: Directory of converted sounds (defaults to
+            get_cache_directory())
+
+    Returns:
+        Path of the converted WAV file
+
+    Raises:
+        wave.Error, EOFError, OSError or ValueError if the file can't be
+        read or converted
+    """
+    if cache_directory is None:
+        cache_directory = get_cache_directory()
+    name = os.path.splitext(os.path.basename(path))[0]
+    converted = os.path.join(cache_directory, "%s.%s.wav" % (name, hash_file(path)))
+    with _conversion_lock:
+        if os.path.exists(converted):
+            return converted
+        samples = convert_sound(path)
+        os.makedirs(cache_directory, exist_ok=True)
+        # Written under a temporary name, so a partial file is never used
+        temporary = converted + ".tmp"
+        try:
+            write_wav(temporary, ENGINE_RATE, samples)
+            os.replace(temporary, converted)
+        except Exception:
+            _remove_file(temporary)
+            raise
+    return converted
+
+
+def is_converted(path, cache_directory=None):
+    """
+    Tell whether a sound file is in the converted sound cache.
+
+    Args:
+        path: Path of a sound file
+        cache_directory: Directory of converted sounds (defaults to
+            get_cache_directory())
+
+    Returns:
+        True if path is a converted sound
+    """
+    if cache_directory is None:
+        cache_directory = get_cache_directory()
+    return os.path.normcase(os.path.dirname(os.path.abspath(path))) == os.path.normcase(
+        os.path.abspath(cache_directory)
+    )
+
+
+def prune_cache(referenced, cache_directory=None):
+    """
+    Delete the converted sounds that no custom sound uses any more.
+
+    Files left behind by an interrupted conversion are deleted too. Nothing
+    is deleted while a conversion is running.
+
+    Args:
+        referenced: Iterable of the paths of the custom sounds in use
+        cache_directory: Directory of converted sounds (defaults to
+            get_cache_directory())
+
+    Returns:
+        Number of files deleted
+    """
+    if cache_directory is None:
+        cache_directory = get_cache_directory()
+    keep = {
+        os.path.normcase(os.path.basename(path))
+        for path in referenced
+        if is_converted(path, cache_directory)
+    }
+    if not _conversion_lock.acquire(blocking=False):
+        return 0
+    try:
+        try:
+            names = os.listdir(cache_directory)
+        except OSError:
+            return 0
+        removed = 0
+        for name in names:
+            if os.path.normcase(name) not in keep and _remove_file(os.path.join(cache_directory, name)):
+                removed += 1
+        return removed
+    finally:
+        _conversion_lock.release()
+
+
+def _remove_file(path):
+    """
+    Delete a file, ignoring errors.
+
+    Args:
+        path: Path of the file
+
+    Returns:
+        True if the file was deleted
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        return False
+    return True
+
+
+def get_source_name(path):
+    """
+    Get the name of the file a sound was converted from.
+
+    Args:
+        path: Path of a sound file, converted or not
+
+    Returns:
+        File name of the source sound (the file name itself if path isn't
+        a converted sound)
+    """
+    name = os.path.basename(path)
+    stem, digest, extension = (name.rsplit(".", 2) + ["", ""])[:3]
+    if extension and len(digest) == _DIGEST_LENGTH:
+        return "%s.%s" % (stem, extension)
+    return name
@@ -3,14 +3,24 @@
 
 import os
 import json
+import threading
 import wave
 import wx
+import config
+import globalVars
 import ui
 import addonHandler
-from .settingsPanel import get_config, set_config
+from logHandler import log
+from .settingsPanel import get_config, set_config, Hibiki_CONFIG_KEY
+from .soundAssets import load_aliases
+from .soundConversion import get_converted_path, get_source_name, prune_cache
 
 addonHandler.initTranslation()
 
+# Sound customization dialogs being shown; the sounds they converted aren't
+# saved yet, so the converted sound cache isn't pruned meanwhile
+_open_dialogs = set()
+
 # Human-readable names for control types
 CONTROL_DISPLAY_NAMES = {
     'checkbox': _("Checkbox"),
@@ -142,9 +152,122 @@ def set_custom_sounds(custom_sounds):
     set_config("customSounds", json.dumps(custom_sounds))
 
 
+def _get_profile_sound_paths(profile):
+    """
+    Get the paths of the custom sounds of a configuration profile.
+
+    Args:
+        profile: Profile section (or ConfigObj of a profile file)
+
+    Returns:
+        set of sound paths
+    """
+    try:
+        return set(json.loads(profile[Hibiki_CONFIG_KEY]["customSounds"]).values())
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return set()
+
+
+def get_active_custom_sound_paths():
+    """
+    Get the paths of the custom sounds of the active configuration profiles.
+
+    Reads the profiles in memory, which may hold unsaved changes, so it is
+    called from the GUI thread.
+
+    Returns:
+        dict mapping the normalized file name of each profile to the set
+        of its sound paths
+    """
+    return {
+        os.path.normcase(profile.filename): _get_profile_sound_paths(profile)
+        for profile in config.conf.profiles
+        if profile.filename
+    }
+
+
+def get_all_custom_sound_paths(active_paths):
+    """
+    Get the paths of the custom sounds of every configuration profile.
+
+    Profiles that aren't active are read from their files, so the sounds
+    chosen in them still count as used.
+
+    Args:
+        active_paths: Result of get_active_custom_sound_paths()
+
+    Returns:
+        set of sound paths
+    """
+    from configobj import ConfigObj
+    config_path = globalVars.appArgs.configPath
+    profiles_directory = os.path.join(config_path, "profiles")
+    try:
+        names = [name for name in os.listdir(profiles_directory) if name.endswith(".ini")]
+    except OSError:
+        names = []
+    paths = set()
+    for profile_paths in active_paths.values():
+        paths.update(profile_paths)
+    for path in [os.path.join(config_path, "nvda.ini")] + [os.path.join(profiles_directory, name) for name in names]:
+        if os.path.normcase(path) in active_paths:
+            continue
+        try:
+            paths.update(_get_profile_sound_paths(ConfigObj(path, encoding="UTF-8")))
+        except Exception:
+            continue
+    return paths
+
+
+def prune_custom_sound_cache():
+    """
+    Delete the converted sounds that no profile's custom sounds use.
+
+    Profile files are read and sounds deleted on a background thread.
+    Nothing is deleted while a sound customization dialog is open: the
+    sounds converted in it aren't saved in any profile yet.
+    """
+    if _open_dialogs:
+        return
+    try:
+        active_paths = get_active_custom_sound_paths()
+    except Exception:
+        log.debugWarning("Hibiki: could not prune the converted sound cache", exc_info=True)
+        return
+    threading.Thread(
+        target=_prune_custom_sound_cache,
+        args=(active_paths,),
+        name="HibikiCachePrune",
+        daemon=True,
+    ).start()
+
+
+def _prune_custom_sound_cache(active_paths):
+    """
+    Delete the unused converted sounds, on a background thread.
+
+    Args:
+        active_paths: Result of get_active_custom_sound_paths()
+    """
+    try:
+        referenced = get_all_custom_sound_paths(active_paths)
+        # A dialog may have been opened since
+        if _open_dialogs:
+            return
+        removed = prune_cache(referenced)
+    except Exception:
+        log.debugWarning("Hibiki: could not prune the converted sound cache", exc_info=True)
+        return
+    if removed:
+        log.debug("Hibiki: removed %d unused converted sounds" % removed)
+
+
 def validate_wav_file(filepath):
     """
-    Validate that a WAV file is compatible with camlorn_audio (mono, 44100Hz).
+    Validate that a WAV file can be converted for playback.
+
+    Any channel count and sample rate is accepted: the file is converted to
+    mono at the engine's sample rate when chosen (see soundConversion).
     
     Args:
         filepath: Path to the WAV file
@@ -154,15 +277,10 @@ def validate_wav_file(filepath):
     """
     try:
         with wave.open(filepath, 'rb') as wav:
-            channels = wav.getnchannels()
-            framerate = wav.getframerate()
-            
-            if channels != 1:
-                return False, _("The file must be mono (1 channel). This file has {} channels.").format(channels)
+            sample_width = wav.getsampwidth()
             
-            if framerate != 44100:
-                # Warning but still allow
-                return True, _("Warning: Recommended sample rate is 44100 Hz. This file has {} Hz.").format(framerate)
+            if sample_width not in (1, 2, 3, 4):
+                return False, _("Unsupported sample size: {} bits.").format(sample_width * 8)
             
             return True, None
     except wave.Error as e:
@@ -194,6 +312,14 @@ class SoundCustomizationDialog(wx.Dialog):
         self._populate_list()
         self.Centre()
     
+    def ShowModal(self):
+        """Show the dialog; the converted sound cache isn't pruned meanwhile."""
+        _open_dialogs.add(self)
+        try:
+            return super().ShowModal()
+        finally:
+            _open_dialogs.discard(self)
+    
     def _create_ui(self):
         """Create the dialog UI elements."""
         panel = wx.Panel(self)
@@ -203,7 +329,7 @@ class SoundCustomizationDialog(wx.Dialog):
         # Translators: Instructions shown at top of sound customization dialog
         instructions = wx.StaticText(panel, label=_(
             "Select a control type and click 'Change Sound' to assign a custom WAV file.\n"
-            "Sound files must be mono (1 channel) and preferably 44100 Hz."
+            "Sound files are converted to mono 44100 Hz, with silence at the start and end removed."
         ))
         main_sizer.Add(instructions, 0, wx.ALL | wx.EXPAND, 10)
         
@@ -267,7 +393,7 @@ class SoundCustomizationDialog(wx.Dialog):
             # Get current sound (custom or default)
             if control_key in self.custom_sounds:
                 sound_path = self.custom_sounds[control_key]
-                sound_name = os.path.basename(sound_path) + _(" (custom)")
+                sound_name = get_source_name(sound_path) + _(" (custom)")
             else:
                 sound_name = DEFAULT_SOUNDS.get(control_key, _("None"))
             
@@ -314,20 +440,60 @@ class SoundCustomizationDialog(wx.Dialog):
                 )
                 return
             
-            # Show warning if any
-            if message:
-                wx.MessageBox(
-                    message,
-                    _("Warning"),
-                    wx.OK | wx.ICON_WARNING
-                )
-            
-            # Save the custom sound
-            self.custom_sounds[control_key] = filepath
-            self._populate_list()
-            
-            # Translators: Confirmation message after changing sound
-            ui.message(_("Sound changed successfully."))
+            # Convert the sound once, so playback needs no conversion. This
+            # can take seconds, so it runs on a background thread
+            self.change_btn.Disable()
+            # Translators: Message while a chosen sound file is being converted
+            ui.message(_("Converting sound..."))
+            threading.Thread(
+                target=self._convert_sound,
+                args=(control_key, filepath),
+                name="HibikiSoundConversion",
+                daemon=True,
+            ).start()
+    
+    def _convert_sound(self, control_key, filepath):
+        """
+        Convert a chosen sound file, on a background thread.
+        
+        Args:
+            control_key: Control type the sound is chosen for
+            filepath: Path of the chosen WAV file
+        """
+        try:
+            converted, error = get_converted_path(filepath), None
+        except Exception as e:
+            converted, error = None, e
+        wx.CallAfter(self._on_sound_converted, control_key, converted, error)
+    
+    def _on_sound_converted(self, control_key, converted, error):
+        """
+        Use a converted sound, on the GUI thread.
+        
+        Args:
+            control_key: Control type the sound is chosen for
+            converted: Path of the converted sound, or None if it failed
+            error: Exception raised by the conversion, or None
+        """
+        # The dialog may have been closed during the conversion
+        if not self:
+            return
+        self.change_btn.Enable()
+        if error is not None:
+            wx.MessageBox(
+                # Translators: Error shown when a chosen sound file can't be converted
+                _("Could not convert the sound file: {}").format(str(error)),
+                _("Invalid Sound File"),
+                wx.OK | wx.ICON_ERROR
+            )
+            return
+        
+        # Save the custom sound
+        self.custom_sounds[control_key] = converted
+        self._populate_list()
+        
+        # Translators: Confirmation message after changing sound
+        ui.message(_("Sound changed successfully."))
     
     def _on_preview(self, event):
         """Handle Preview button click."""
@@ -342,6 +508,8 @@ class SoundCustomizationDialog(wx.Dialog):
         else:
             default_sound = DEFAULT_SOUNDS.get(control_key)
             if default_sound:
+                # The packaged add-on ships one copy of identical sounds
+                default_sound = load_aliases(self.sounds_directory).get(default_sound, default_sound)
                 sound_path = os.path.join(self.sounds_directory, default_sound)
             else:
                 ui.message(_("No sound assigned."))
@@ -394,4 +562,7 @@ class SoundCustomizationDialog(wx.Dialog):
     def _on_ok(self, event):
         """Handle OK button - save changes."""
         set_custom_sounds(self.custom_sounds)
+        # Its sounds are saved now, so the sounds it no longer uses can go
+        _open_dialogs.discard(self)
+        prune_custom_sound_cache()
         self.EndModal(wx.ID_OK)
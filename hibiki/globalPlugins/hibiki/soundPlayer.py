@@ -1,15 +1,73 @@
 # soundPlayer.py - 3D audio playback system
 # Part of Hibiki add-on for NVDA
 
+import itertools
 import os
+import queue
 import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
 import api
-from .camlorn_audio import init_camlorn_audio, Sound3D
+import winUser
+from logHandler import log
+from .roleMapper import get_sounds_for_key, get_table_generation
+from .audioData import DecodedSound, decode_wav, start_decoding
+from .soundBank import SoundBank, BANK_FILENAME
+from .soundAssets import load_aliases
+from .voicePool import VoicePool, PooledSound, MAX_VOICES, VOICES_PER_SOUND
+from .playbackScheduler import PlaybackScheduler, UTTERANCE_GATHER_TIME
+from .duplicateFilter import DuplicateFilter
+from .compositeCache import CompositeCache
+from .customSoundCache import CustomSoundCache
+from .audioBackends import CamlornBackend
 
 # Audio positioning constants
 AUDIO_WIDTH = 25.0  # Width of the audio space
 AUDIO_DEPTH = 5.0   # Depth (z-axis) for all sounds
 
+# Maximum number of memoized earcon plans
+PLAN_CACHE_SIZE = 256
+
+# Seconds after which the cached desktop geometry is re-read even without
+# a display change notification
+GEOMETRY_REFRESH_INTERVAL = 5.0
+
+# Maximum seconds a location read may take before the object's window is
+# treated as slow
+LOCATION_TIME_BUDGET = 0.05
+
+# Seconds during which locations are not read from a window that exceeded
+# the budget or was reported hung
+LOCATION_COOLDOWN = 2.0
+
+# Seconds during which a sound that failed to load is not retried; after
+# that, one stat tells whether its file appeared or changed
+SOUND_RETRY_INTERVAL = 10.0
+
+# Returned by SoundPlayer._read_location when the location wasn't read
+_LOCATION_UNAVAILABLE = object()
+
+# Window messages after which the desktop geometry must be re-read
+WM_SETTINGCHANGE = 0x001A
+WM_DISPLAYCHANGE = 0x007E
+WM_DPICHANGED = 0x02E0
+_GEOMETRY_MESSAGES = frozenset((WM_SETTINGCHANGE, WM_DISPLAYCHANGE, WM_DPICHANGED))
+
+# Seconds to wait for the audio thread to finish on shutdown
+AUDIO_THREAD_JOIN_TIMEOUT = 2.0
+
+# Immutable playback request passed from the speech hooks to the audio thread
+# (queued as a tuple holding the commands of one earcon). event numbers the
+# navigation event the sound belongs to, navigation the gesture or focus
+# change that queued the event, and time is when it was queued
+# (time.perf_counter()). gather is True for the fields of a browse mode
+# utterance, which more fields may join, and priority orders sounds for the
+# event's voice budget (lower plays first): it is (index in the plan, field).
+PlayCommand = namedtuple("PlayCommand", (
+    "sound", "x", "y", "z", "gain", "event", "navigation", "time", "gather", "priority",
+))
+
 class SoundPlayer:
     """
     Manages loading and playing 3D positional sounds.
@@ -18,156 +76,938 @@ class SoundPlayer:
     of NVDA objects, providing spatial audio feedback.
     """
 
-    def __init__(self, sounds_directory):
+    def __init__(self, sounds_directory, max_voices=MAX_VOICES, voices_per_sound=VOICES_PER_SOUND, backend=None):
         """
-        Initialize the sound player and preload all sounds.
+        Initialize the sound player.
+
+        Returns immediately: the audio engine is started and the default
+        sounds are loaded on the audio thread, so NVDA's startup doesn't
+        wait for them.
 
         Args:
             sounds_directory: Path to directory containing WAV sound files
+            max_voices: Maximum number of voices playing at the same time
+            voices_per_sound: Maximum number of voices allocated per sound
+            backend: AudioBackend to play through (camlorn_audio by default)
         """
-        # Initialize the 3D audio engine
-        init_camlorn_audio()
+        self.backend = backend if backend is not None else CamlornBackend()
 
         # Store sounds directory for loading custom sounds later
         self.sounds_directory = sounds_directory
 
-        # Dictionary to store loaded sounds and a lock to protect concurrent access
+        # Dictionary to store loaded sounds (PooledSound) and a lock to protect concurrent access
         self.sounds = {}
         self._sounds_lock = threading.Lock()
+        # Default sound names the build replaced by an identical shipped file
+        self._aliases = load_aliases(sounds_directory)
+        # Names of the files in the sounds directory, listed once by the
+        # audio thread so loading default sounds doesn't stat each file
+        self._sound_index = None
+
+        # Voices are allocated from a shared pool so overlapping earcons of
+        # the same sound don't cut each other off
+        self.voice_pool = VoicePool(self.backend.create_voice, max_voices, voices_per_sound)
+        # Last gain set on each voice other than 1.0, by voice (entries are
+        # removed when the voice is freed); only touched by the audio thread
+        self._voice_gains = {}
+
+        # Location reads: windows to skip until a deadline, last position
+        # used, and counters for diagnostics
+        self._slow_windows = {}
+        self._last_position = None
+        # (utterance, object, location) of the last location read for a
+        # browse mode field, reused by the nested fields of the utterance
+        self._utterance_location = None
+        self.location_timeouts = 0
+        self.location_skips = 0
+
+        # Recently played earcons, so repeated speech for one control
+        # plays its earcon once
+        self.duplicates = DuplicateFilter()
+
+        # Cached screen-to-audio transform (see _get_geometry)
+        self._geometry = None
+        self._geometry_time = 0.0
+        try:
+            from winAPI.messageWindow import pre_handleWindowMessage
+            pre_handleWindowMessage.register(self._on_window_message)
+        except ImportError:
+            # Older NVDA: rely on the periodic refresh only
+            pass
+
+        # LRU memo of earcon plans: sound key -> tuple of loaded sounds.
+        # Tagged with the resolution table generation so customization
+        # changes invalidate it.
+        self._plans = OrderedDict()
+        self._plans_lock = threading.Lock()
+        self._plans_generation = get_table_generation()
+        self.plan_hits = 0
+        self.plan_misses = 0
 
         # Import role and state mappings
         from .roleMapper import ROLE_SOUND_MAP, STATE_SOUND_MAP
 
-        # Preload all role sounds
-        for role, filename in ROLE_SOUND_MAP.items():
-            sound_path = os.path.join(sounds_directory, filename)
-            if os.path.exists(sound_path):
+        # Register all role and state sounds (avoiding duplicates) for
+        # preloading on the audio thread
+        self._preload = []
+        # Pre-decoded sound bank generated by build_addon.py, opened by the
+        # audio thread the first time decoded audio is needed
+        self._bank = None
+        self._bank_opened = False
+        for filename in list(ROLE_SOUND_MAP.values()) + list(STATE_SOUND_MAP.values()):
+            if filename in self.sounds:
+                continue
+            # Aliases share the PooledSound of their shipped file
+            shipped = self._aliases.get(filename, filename)
+            sound = self.sounds.get(shipped)
+            if sound is None:
+                sound = PooledSound(os.path.join(sounds_directory, shipped))
+                self.sounds[shipped] = sound
+                self._preload.append(sound)
+            self.sounds[filename] = sound
+
+        # The audio engine runs on a dedicated audio thread, which starts it,
+        # preloads the sounds and executes playback requests, so the speech
+        # hooks never wait on engine calls or file loads.
+        # SimpleQueue.put never blocks and takes no Python-level lock.
+        self._commands = queue.SimpleQueue()
+        self._terminated = False
+        # Numbers navigation events; next() on a count is atomic in CPython
+        self._events = itertools.count()
+        # Current navigation (see begin_navigation), which the events queued
+        # now belong to
+        self._navigations = itertools.count(1)
+        self.navigation = 0
+        # Browse mode utterance being queued, its event number and the
+        # number of its fields queued so far
+        self._utterance = None
+        self._utterance_event = None
+        self._utterance_fields = 0
+        # Latest-wins coalescing of queued events, used by the audio thread.
+        # Set scheduler.window to change the coalescing window.
+        self.scheduler = PlaybackScheduler()
+        # Pre-mixed sounds of multi-sound earcons, used by the audio thread
+        self.composites = CompositeCache(
+            sounds_directory, self._load_sound, self._free_sound, self._get_bank_pcm,
+        )
+        # Memory budget of loaded custom sounds, used by the audio thread
+        self.custom_sounds = CustomSoundCache(self._free_sound)
+        self._audio_thread = threading.Thread(
+            target=self._run_audio_thread,
+            name="HibikiAudio",
+            daemon=True,
+        )
+        self._audio_thread.start()
+
+    def terminate(self):
+        """Stop the audio thread and silence every voice."""
+        # Earcons queued after this (e.g. by speech commands still pending)
+        # would have no consumer, so they are dropped
+        self._terminated = True
+        try:
+            from winAPI.messageWindow import pre_handleWindowMessage
+            pre_handleWindowMessage.unregister(self._on_window_message)
+        except ImportError:
+            pass
+        self._commands.put(None)
+        self._audio_thread.join(AUDIO_THREAD_JOIN_TIMEOUT)
+        self.voice_pool.stop_all()
+        if not self._audio_thread.is_alive():
+            self.composites.close()
+            self.custom_sounds.clear()
+            try:
+                self.backend.terminate()
+            except Exception:
+                pass
+            if self._bank is not None:
+                self._bank.close()
+
+    def _run_audio_thread(self):
+        """
+        Start the engine, then execute queued earcons (tuples of
+        PlayCommands) until None arrives.
+
+        Default sounds are loaded while the queue is empty, on this thread.
+        For backends that need decoded audio (needs_pcm), they are taken
+        from the sound bank, or read and decoded on a thread pool while the
+        engine starts; other backends read the files themselves, so nothing
+        is decoded in Python for them, and they are loaded one by one, with
+        the engine reading each file. Playback requests take priority and
+        load the sounds they need on demand.
+        """
+        commands = self._commands
+        preload_start = time.perf_counter()
+        self._sound_index = self._index_sounds_directory()
+        if self.backend.needs_pcm:
+            decoding = self._start_preload_decoding()
+        else:
+            decoding = [None] * len(self._preload)
+        if not self._start_engine():
+            # No engine: discard requests until terminated
+            while commands.get() is not None:
+                pass
+            return
+
+        pending = list(reversed(list(zip(self._preload, decoding))))
+        report = []
+        while True:
+            if pending:
                 try:
-                    sound = Sound3D(sound_path)
-                    # Set rolloff_factor to 0 to disable volume falloff with distance
-                    # This ensures consistent volume regardless of position
-                    sound.set_rolloff_factor(0)
-                    self.sounds[filename] = sound
-                except Exception as e:
-                    # Silently skip sounds that fail to load
-                    pass
-
-        # Preload all state sounds (avoiding duplicates)
-        for state, filename in STATE_SOUND_MAP.items():
-            sound_path = os.path.join(sounds_directory, filename)
-            if os.path.exists(sound_path) and filename not in self.sounds:
+                    item = commands.get_nowait()
+                except queue.Empty:
+                    sound, future = pending.pop()
+                    decoded, decode_time = future.result() if future is not None else (None, None)
+                    upload_start = time.perf_counter()
+                    if not sound.loaded and not sound.failed:
+                        self._load_sound(sound, decoded)
+                    report.append((sound.path, decode_time, time.perf_counter() - upload_start))
+                    if not pending:
+                        self._log_load_report(report, time.perf_counter() - preload_start)
+                    continue
+            else:
+                item = commands.get()
+            if item is None:
+                break
+            if not self._execute_batch(list(item)):
+                break
+
+    def _execute_batch(self, batch):
+        """
+        Execute queued commands and every command queued behind them.
+
+        The queue is drained first so the scheduler can drop the commands of
+        events that a newer event already superseded. For browse mode
+        utterances, the other fields are awaited for up to
+        UTTERANCE_GATHER_TIME, so the voice budget picks among all of them.
+
+        Sounds of one plan at the same position are played as a single
+        pre-mixed composite once it is built (see CompositeCache). The voices
+        of the whole batch are then started with one backend.play_batch().
+
+        Args:
+            batch: List of the PlayCommands of the first queued earcon
+
+        Returns:
+            False if a None item (shutdown) was found
+        """
+        running = True
+        first = batch[0]
+        deadline = first.time + UTTERANCE_GATHER_TIME if first.gather else 0.0
+        while True:
+            try:
+                timeout = deadline - time.perf_counter()
+                if timeout > 0:
+                    item = self._commands.get(timeout=timeout)
+                else:
+                    item = self._commands.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                running = False
+                break
+            batch.extend(item)
+            if item[0].gather and not deadline:
+                deadline = item[0].time + UTTERANCE_GATHER_TIME
+
+        scheduler = self.scheduler
+        entries = []
+        for group in self._group_commands(scheduler.apply_budget(scheduler.coalesce(batch))):
+            for command in group:
+                for voice in scheduler.start(command):
+                    self.voice_pool.release(voice)
+            if len(group) > 1:
+                composite = self.composites.get(group)
+                if composite is not None:
+                    group = (group[0]._replace(sound=composite),)
+            for command in group:
                 try:
-                    sound = Sound3D(sound_path)
-                    sound.set_rolloff_factor(0)
-                    self.sounds[filename] = sound
-                except Exception as e:
-                    # Silently skip sounds that fail to load
-                    pass
+                    voice = self._prepare_voice(command)
+                except Exception:
+                    # Silently skip sounds that fail to play
+                    continue
+                if voice is not None:
+                    entries.append((voice, command.x, command.y, command.z))
+        if entries:
+            try:
+                self.backend.play_batch(entries)
+            except Exception:
+                pass
+            for voice, _x, _y, _z in entries:
+                scheduler.add_voice(voice)
+        return running
 
-    def play_for_object(self, obj, sound_filenames):
+    def _group_commands(self, commands):
         """
-        Play sounds with 3D positioning based on object's screen location.
+        Split commands into groups of the same plan, position and gain.
 
-        The object's screen coordinates are mapped to a 3D audio space:
-        - X axis: left (-AUDIO_WIDTH) to right (+AUDIO_WIDTH)
-        - Y axis: top to bottom (inverted, accounting for aspect ratio)
-        - Z axis: constant depth (AUDIO_DEPTH)
+        Commands of one plan were queued together, so they share their
+        event, queue time and field.
 
         Args:
-            obj: NVDA object to play sounds for
-            sound_filenames: List of sound filenames to play
+            commands: List of PlayCommands, oldest first
+
+        Returns:
+            List of lists of PlayCommands
+        """
+        groups = []
+        for command in commands:
+            if groups:
+                last = groups[-1][0]
+                if (
+                    last.event == command.event
+                    and last.time == command.time and last.priority[1] == command.priority[1]
+                    and last.x == command.x and last.y == command.y and last.z == command.z
+                    and last.gain == command.gain
+                ):
+                    groups[-1].append(command)
+                    continue
+            groups.append([command])
+        return groups
+
+    def _index_sounds_directory(self):
+        """
+        List the files in the sounds directory.
+
+        Returns:
+            frozenset of file names, or None if the directory can't be read
+        """
+        try:
+            return frozenset(os.listdir(self.sounds_directory))
+        except OSError:
+            return None
+
+    def _get_bank(self):
+        """
+        Get the pre-decoded sound bank, opening it the first time.
+
+        Returns:
+            SoundBank, or None if the add-on ships no usable bank
+        """
+        if not self._bank_opened:
+            self._bank_opened = True
+            self._bank = self._open_bank()
+        return self._bank
+
+    def _open_bank(self):
+        """
+        Open the pre-decoded sound bank, if the add-on ships one.
+
+        Returns:
+            SoundBank, or None if there is no usable bank
+        """
+        path = os.path.join(self.sounds_directory, BANK_FILENAME)
+        if not os.path.exists(path):
+            return None
+        try:
+            return SoundBank(path)
+        except (OSError, ValueError):
+            log.warning("Hibiki: could not open the sound bank", exc_info=True)
+            return None
+
+    def _get_bank_pcm(self, sound):
+        """
+        Get the decoded audio of a default sound from the sound bank.
+
+        Args:
+            sound: PooledSound
+
+        Returns:
+            DecodedSound mapping the bank's PCM data, or None if the sound
+            isn't a default sound or the bank doesn't have it
+        """
+        if os.path.dirname(sound.path) != self.sounds_directory:
+            return None
+        bank = self._get_bank()
+        if bank is None:
+            return None
+        found = bank.get_pcm(os.path.basename(sound.path))
+        if found is None:
+            return None
+        entry, data = found
+        return DecodedSound(sound.path, entry.rate, entry.channels, entry.bits // 8, entry.frames, data)
+
+    def _start_preload_decoding(self):
+        """
+        Get the decoded audio of every preloaded sound.
+
+        Sounds found in the bank are mapped from it without decoding; the
+        others are decoded on a thread pool.
+
+        Returns:
+            List of futures, in the order of self._preload, each resolving to
+            (DecodedSound or None, seconds spent decoding)
+        """
+        futures = [None] * len(self._preload)
+        to_decode = []
+        for index, sound in enumerate(self._preload):
+            start = time.perf_counter()
+            decoded = self._get_bank_pcm(sound)
+            if decoded is None:
+                to_decode.append(index)
+                continue
+            future = Future()
+            future.set_result((decoded, time.perf_counter() - start))
+            futures[index] = future
+
+        if self._bank is not None:
+            log.debug("Hibiki: %d of %d sounds mapped from the sound bank" % (
+                len(self._preload) - len(to_decode), len(self._preload),
+            ))
+        decoding = start_decoding([self._preload[index].path for index in to_decode])
+        for index, future in zip(to_decode, decoding):
+            futures[index] = future
+        return futures
+
+    def _log_load_report(self, report, total_time):
+        """
+        Log how long loading the default sounds took.
+
+        Decoding is only reported for backends that need decoded audio;
+        other engines read and decode the files while loading them, which
+        counts as loading.
+
+        Args:
+            report: List of (path, decode seconds or None if not decoded in
+                Python, load seconds) per file
+            total_time: Wall time of the whole preload in seconds
+        """
+        loaded = sum(1 for sound in self._preload if sound.loaded)
+        load_time = sum(entry[2] for entry in report)
+        if not self.backend.needs_pcm:
+            log.info("Hibiki: loaded %d sounds in %.0f ms (%.0f ms in the engine; files not decoded in Python)" % (
+                loaded, total_time * 1000, load_time * 1000,
+            ))
+            for path, _decode_time, upload_time in report:
+                log.debug("Hibiki: %s load %.1f ms" % (os.path.basename(path), upload_time * 1000))
+            return
+        log.info("Hibiki: loaded %d sounds in %.0f ms (decode %.0f ms, upload %.0f ms)" % (
+            loaded,
+            total_time * 1000,
+            sum(entry[1] or 0.0 for entry in report) * 1000,
+            load_time * 1000,
+        ))
+        for path, decode_time, upload_time in report:
+            log.debug("Hibiki: %s decode %.1f ms, upload %.1f ms" % (
+                os.path.basename(path), (decode_time or 0.0) * 1000, upload_time * 1000,
+            ))
+
+    def _start_engine(self):
+        """
+        Initialize the audio backend on the audio thread.
+
+        Returns:
+            True if the engine started
+        """
+        start = time.perf_counter()
+        try:
+            self.backend.start()
+        except Exception:
+            log.error("Hibiki: could not initialize the audio engine", exc_info=True)
+            return False
+        log.info("Hibiki: %s audio engine started in %.0f ms" % (
+            self.backend.name, (time.perf_counter() - start) * 1000,
+        ))
+        return True
+
+    def _prepare_voice(self, command):
+        """
+        Get a voice ready to play the sound of a command on the audio thread.
+
+        Loads the sound first if it hasn't been loaded yet, and sets the
+        volume of the voice; the caller positions and plays it.
+
+        Args:
+            command: PlayCommand to prepare
+
+        Returns:
+            Voice for the sound, or None if the sound couldn't be loaded
+        """
+        sound = command.sound
+        if not sound.loaded:
+            # Only this thread loads sounds after startup, so no lock is
+            # needed (and the speech hooks never wait on a load)
+            if sound.failed and not self._should_retry(sound):
+                return None
+            self._load_sound(sound)
+            if sound.failed:
+                return None
+        self.custom_sounds.touch(sound)
+        voice = self.voice_pool.acquire(sound)
+        gain = command.gain
+        if self._voice_gains.get(voice, 1.0) != gain:
+            voice.set_volume(gain)
+            if gain == 1.0:
+                del self._voice_gains[voice]
+            else:
+                self._voice_gains[voice] = gain
+        return voice
+
+    def _load_sound(self, sound, decoded=None):
+        """
+        Load a sound file into the backend and create its first voice.
+
+        Marks the sound as failed if the file is missing or can't be loaded.
+        Custom sounds are counted against the custom sound memory budget,
+        and large ones are streamed (see CustomSoundCache).
+
+        Args:
+            sound: PooledSound to load
+            decoded: DecodedSound already read from the file, if any
+        """
+        size = None
+        if decoded is None:
+            if os.path.dirname(sound.path) != self.sounds_directory:
+                size = self._get_size(sound.path)
+                exists = size is not None
+            else:
+                exists = self._sound_file_exists(sound.path)
+            if not exists:
+                self._mark_failed(sound, None)
+                return
+        stream = size is not None and self.custom_sounds.should_stream(size)
+        sound.failed = False
+        try:
+            if decoded is None and self.backend.needs_pcm:
+                decoded = decode_wav(sound.path)
+            sound.buffer = self.backend.load_buffer(sound.path, decoded, stream)
+            voice = self.backend.create_voice(sound.buffer)
+            if decoded is not None:
+                sound.pcm = decoded
+                sound.length = decoded.duration
+            else:
+                sound.length = voice.get_length()
+            # Assume a short earcon if the length is unknown
+            sound.length = sound.length or 1.0
+            sound.voices.append(voice)
+        except Exception:
+            # Silently skip sounds that fail to load
+            self._mark_failed(sound, self._get_mtime(sound.path))
+            return
+        if size is not None:
+            self.custom_sounds.add(sound, size, stream)
+
+    def _free_sound(self, sound):
+        """
+        Stop and free the voices and buffer of a sound.
+
+        Args:
+            sound: PooledSound to free
         """
-        # Get desktop dimensions for normalization
+        for voice in sound.voices:
+            self.voice_pool.release(voice)
+            self._voice_gains.pop(voice, None)
+            try:
+                voice.free()
+            except Exception:
+                pass
+        sound.voices = []
+        sound.pcm = None
+        if sound.buffer is not None:
+            try:
+                self.backend.free_buffer(sound.buffer)
+            except Exception:
+                pass
+            sound.buffer = None
+
+    def _sound_file_exists(self, path):
+        """
+        Check whether a sound file exists.
+
+        Files of the sounds directory are looked up in its index; other
+        paths (custom sounds) are checked on disk.
+
+        Args:
+            path: Absolute path of the sound file
+
+        Returns:
+            True if the file exists
+        """
+        directory, name = os.path.split(path)
+        if self._sound_index is not None and directory == self.sounds_directory:
+            return name in self._sound_index
+        return os.path.exists(path)
+
+    def _get_mtime(self, path):
+        """
+        Get the modification time of a file.
+
+        Args:
+            path: Path of the file
+
+        Returns:
+            Modification time, or None if the file doesn't exist
+        """
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def _get_size(self, path):
+        """
+        Get the size of a file.
+
+        Args:
+            path: Path of the file
+
+        Returns:
+            Size in bytes, or None if the file doesn't exist
+        """
+        try:
+            return os.stat(path).st_size
+        except OSError:
+            return None
+
+    def _mark_failed(self, sound, mtime):
+        """
+        Remember that a sound couldn't be loaded.
+
+        Args:
+            sound: PooledSound that failed to load
+            mtime: Modification time of its file, or None if it is missing
+        """
+        sound.failed = True
+        sound.failed_mtime = mtime
+        sound.retry_time = time.monotonic() + SOUND_RETRY_INTERVAL
+
+    def _should_retry(self, sound):
+        """
+        Check whether a failed sound should be loaded again.
+
+        At most once per SOUND_RETRY_INTERVAL, the file is checked with a
+        single stat; the sound is retried only if the file appeared or
+        changed since it failed, so a missing custom sound doesn't touch
+        the disk on every navigation event.
+
+        Args:
+            sound: PooledSound that failed to load
+
+        Returns:
+            True if the sound should be loaded again
+        """
+        now = time.monotonic()
+        if now < sound.retry_time:
+            return False
+        sound.retry_time = now + SOUND_RETRY_INTERVAL
+        mtime = self._get_mtime(sound.path)
+        return mtime is not None and mtime != sound.failed_mtime
+
+    def get_plan(self, key):
+        """
+        Get the tuple of sounds to play for a sound key.
+
+        Plans are memoized in a bounded LRU keyed by the compact
+        (role, states bitmask, level) key from roleMapper.get_sound_key(),
+        so repeated role/state combinations skip sound resolution entirely.
+        Plans keep sounds that failed to load: the audio thread skips them
+        and retries them if their file appears or changes.
+
+        Args:
+            key: tuple (role, states_bitmask, level)
+
+        Returns:
+            Tuple of PooledSound objects (possibly empty)
+        """
+        with self._plans_lock:
+            generation = get_table_generation()
+            if generation != self._plans_generation:
+                self._plans.clear()
+                self._plans_generation = generation
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                self.plan_hits += 1
+                return plan
+            self.plan_misses += 1
+
+        plan = tuple(map(self._get_sound, get_sounds_for_key(key)))
+
+        with self._plans_lock:
+            if generation == self._plans_generation:
+                self._plans[key] = plan
+                if len(self._plans) > PLAN_CACHE_SIZE:
+                    self._plans.popitem(last=False)
+        return plan
+
+    def get_plan_stats(self):
+        """
+        Get earcon plan memo statistics.
+
+        Returns:
+            dict with hits, misses, size and hit ratio
+        """
+        total = self.plan_hits + self.plan_misses
+        return {
+            "hits": self.plan_hits,
+            "misses": self.plan_misses,
+            "size": len(self._plans),
+            "hitRatio": float(self.plan_hits) / total if total else 0.0,
+        }
+
+    def _on_window_message(self, msg, **kwargs):
+        """Invalidate the cached desktop geometry on display or DPI changes."""
+        if msg in _GEOMETRY_MESSAGES:
+            self.invalidate_geometry()
+
+    def invalidate_geometry(self):
+        """Force the desktop geometry to be re-read on the next sound."""
+        self._geometry = None
+
+    def _get_geometry(self):
+        """
+        Get the cached screen-to-audio transform, refreshing it if needed.
+
+        The transform maps screen coordinates to audio space with a multiply
+        and an add per axis:
+        - X: left (-AUDIO_WIDTH) to right (+AUDIO_WIDTH)
+        - Y: top to bottom, scaled by the aspect ratio and inverted
+          (screen coords are top-down, audio is bottom-up)
+
+        Returns:
+            tuple (width, height, scale_x, offset_x, scale_y, offset_y),
+            or None if the desktop object is unavailable
+        """
+        geometry = self._geometry
+        now = time.monotonic()
+        if geometry is not None and now - self._geometry_time < GEOMETRY_REFRESH_INTERVAL:
+            return geometry
+
         desktop = api.getDesktopObject()
         if desktop is None:
+            return None
+        location = desktop.location
+        width = location[2]
+        height = location[3]
+
+        if width <= 0 or height <= 0:
+            # Invalid dimensions: play everything at the center
+            geometry = (width, height, 0.0, 0.0, 0.0, 0.0)
+        else:
+            aspect = float(height) / float(width)
+            geometry = (
+                width,
+                height,
+                (AUDIO_WIDTH * 2) / float(width),
+                -AUDIO_WIDTH,
+                -(aspect * AUDIO_WIDTH * 2) / float(height),
+                aspect * AUDIO_WIDTH,
+            )
+        self._geometry = geometry
+        self._geometry_time = now
+        return geometry
+
+    def _read_location(self, obj):
+        """
+        Read an object's location once, within a time budget.
+
+        A location read is a cross-process call that can block for a long
+        time in a slow or hung application, and it can't be interrupted once
+        started. So windows that Windows reports as hung are not queried at
+        all, and a window whose read exceeded LOCATION_TIME_BUDGET is not
+        queried again for LOCATION_COOLDOWN seconds.
+
+        Args:
+            obj: NVDA object
+
+        Returns:
+            Location tuple (left, top, width, height), None if the object has
+            no location, or _LOCATION_UNAVAILABLE if the read was skipped or
+            failed
+        """
+        hwnd = getattr(obj, 'windowHandle', None)
+        if hwnd:
+            deadline = self._slow_windows.get(hwnd)
+            if deadline is not None:
+                if time.monotonic() < deadline:
+                    self.location_skips += 1
+                    return _LOCATION_UNAVAILABLE
+                del self._slow_windows[hwnd]
+            if winUser.user32.IsHungAppWindow(hwnd):
+                self.location_skips += 1
+                self._slow_windows[hwnd] = time.monotonic() + LOCATION_COOLDOWN
+                return _LOCATION_UNAVAILABLE
+
+        start = time.perf_counter()
+        try:
+            location = obj.location
+        except Exception:
+            location = _LOCATION_UNAVAILABLE
+        if time.perf_counter() - start > LOCATION_TIME_BUDGET:
+            self.location_timeouts += 1
+            if hwnd:
+                self._slow_windows[hwnd] = time.monotonic() + LOCATION_COOLDOWN
+        return location
+
+    def get_location_stats(self):
+        """
+        Get location read statistics.
+
+        Returns:
+            dict with the number of reads over budget and of skipped reads
+        """
+        return {
+            "timeouts": self.location_timeouts,
+            "skips": self.location_skips,
+        }
+
+    def begin_navigation(self):
+        """
+        Start a new navigation.
+
+        Called for every gesture and focus change. The earcons queued until
+        the next call belong to this navigation, so they are never
+        coalesced with each other (e.g. the focus ancestors and the focus,
+        or the fields of one browse mode line); only a later navigation
+        supersedes them.
+        """
+        self.navigation = next(self._navigations)
+
+    def play_for_object(self, obj, plan, utterance=None, navigation=None):
+        """
+        Play sounds with 3D positioning based on object's screen location.
+
+        The center of the object is mapped to audio space with the cached
+        transform from _get_geometry(); all sounds use a constant depth
+        (AUDIO_DEPTH). If the location can't be read in time, the last
+        known position (or the center of the screen) is used instead.
+
+        Nothing is played if the same earcon was just played for the same
+        object, or for a control with the same window and location. Nested
+        fields of one browse mode utterance resolve to the same object, so
+        its location is only read for the first of them.
+
+        Args:
+            obj: NVDA object to play sounds for
+            plan: Tuple of sounds from get_plan()
+            utterance: Browse mode utterance number of the control field,
+                or None for an object; the fields of one utterance form one
+                event for the scheduler
+            navigation: Navigation the earcon was generated for, or None for
+                the current one
+        """
+        duplicates = self.duplicates
+        # Same object: skip before reading its location
+        if duplicates.is_duplicate(obj, plan):
             return
-        desktop_max_x = desktop.location[2]  # Width
-        desktop_max_y = desktop.location[3]  # Height
-
-        # Validate desktop dimensions to prevent division by zero
-        if desktop_max_x <= 0 or desktop_max_y <= 0:
-            position_x = 0.0
-            position_y = 0.0
-            position_z = AUDIO_DEPTH * -1
-            for sound_path_or_name in sound_filenames:
-                sound = self._get_or_load_sound(sound_path_or_name)
-                if sound:
-                    try:
-                        sound.set_position(position_x, position_y, position_z)
-                        sound.play()
-                    except Exception:
-                        pass
+        geometry = self._get_geometry()
+        if geometry is None:
             return
+        width, height, scale_x, offset_x, scale_y, offset_y = geometry
+        position_z = AUDIO_DEPTH * -1
 
-        desktop_aspect = float(desktop_max_y) / float(desktop_max_x)
+        last = self._utterance_location
+        if utterance is not None and last is not None and last[0] == utterance and last[1] is obj:
+            location = last[2]
+        else:
+            location = self._read_location(obj)
+            if utterance is not None:
+                self._utterance_location = (utterance, obj, location)
+        if location is _LOCATION_UNAVAILABLE:
+            # Slow or hung application: don't wait, reuse the last position
+            if self._last_position is not None:
+                duplicates.add(obj, plan)
+                self._play_plan_at(plan, *self._last_position, utterance=utterance, navigation=navigation)
+                return
+            location = None
+
+        key = None
+        if location is not None:
+            key = (getattr(obj, 'windowHandle', None), tuple(location))
+            if duplicates.is_duplicate(obj, plan, key):
+                return
+        duplicates.add(obj, plan, key)
 
-        # Calculate center position of object
-        if obj.location is not None:
+        if location is not None:
             # Object has a location, use its center point
-            obj_x = obj.location[0] + (obj.location[2] / 2.0)
-            obj_y = obj.location[1] + (obj.location[3] / 2.0)
+            obj_x = location[0] + (location[2] / 2.0)
+            obj_y = location[1] + (location[3] / 2.0)
         else:
             # No location available, default to center of screen
-            obj_x = desktop_max_x / 2.0
-            obj_y = desktop_max_y / 2.0
+            obj_x = width / 2.0
+            obj_y = height / 2.0
 
-        # Convert screen coordinates to 3D audio space
-        # X: normalize to 0-1, scale to -AUDIO_WIDTH to +AUDIO_WIDTH
-        position_x = (obj_x / desktop_max_x) * (AUDIO_WIDTH * 2) - AUDIO_WIDTH
+        position = (obj_x * scale_x + offset_x, obj_y * scale_y + offset_y, position_z)
+        self._last_position = position
+        self._play_plan_at(plan, *position, utterance=utterance, navigation=navigation)
 
-        # Y: normalize to 0-1, scale by aspect ratio, adjust for top-down coordinate system
-        position_y = (obj_y / desktop_max_y) * (desktop_aspect * AUDIO_WIDTH * 2) - (desktop_aspect * AUDIO_WIDTH)
-        position_y *= -1  # Invert Y axis (screen coords are top-down, audio is bottom-up)
+    def _play_plan_at(self, plan, position_x, position_y, position_z, gain=1.0, utterance=None,
+            navigation=None):
+        """
+        Queue every sound of a plan for playback at the given 3D position.
 
-        # Z: constant depth for all sounds
-        position_z = AUDIO_DEPTH * -1
+        Returns immediately; the audio thread loads the sounds if needed,
+        takes voices from the voice pool and plays them. The sounds form one
+        navigation event for the scheduler, shared with the other fields of
+        the same browse mode utterance.
 
-        # Play each sound with the calculated position
-        for sound_path_or_name in sound_filenames:
-            sound = self._get_or_load_sound(sound_path_or_name)
-            if sound:
-                try:
-                    sound.set_position(position_x, position_y, position_z)
-                    sound.play()
-                except Exception as e:
-                    # Silently skip sounds that fail to play
-                    pass
+        Args:
+            plan: Tuple of sounds from get_plan()
+            position_x: X coordinate in audio space
+            position_y: Y coordinate in audio space
+            position_z: Z coordinate in audio space
+            gain: Volume of the sounds (1.0 is unchanged)
+            utterance: Browse mode utterance number, or None
+            navigation: Navigation the sounds belong to, or None for the
+                current one
+        """
+        if not plan or self._terminated:
+            return
+        if navigation is None:
+            navigation = self.navigation
+        if utterance is not None and utterance == self._utterance:
+            event = self._utterance_event
+            self._utterance_fields += 1
+        else:
+            event = next(self._events)
+            self._utterance = utterance
+            self._utterance_event = event
+            self._utterance_fields = 0
+        # Role sounds (first in a plan) before state sounds, then inner
+        # fields (queued later) before outer ones
+        field = -self._utterance_fields
+        gather = utterance is not None
+        queued = time.perf_counter()
+        self._commands.put(tuple(
+            PlayCommand(
+                sound, position_x, position_y, position_z, gain, event, navigation, queued, gather,
+                (index, field),
+            )
+            for index, sound in enumerate(plan)
+        ))
 
-    def _get_or_load_sound(self, sound_path_or_name):
+    def _get_sound(self, sound_path_or_name):
         """
-        Get a sound from cache or load it if it's a custom path.
+        Get the PooledSound for a filename or custom path.
 
-        Thread-safe: uses a lock to prevent race conditions when lazily
-        loading custom sounds from concurrent speech hook calls.
+        Does no disk access: sounds that aren't known yet are registered
+        unloaded and loaded by the audio thread on first play.
+
+        Thread-safe: uses a lock to prevent race conditions when custom
+        sounds are registered from concurrent speech hook calls.
 
         Args:
             sound_path_or_name: Either a filename (default sound) or absolute path (custom sound)
 
         Returns:
-            Sound3D object or None if loading fails
+            PooledSound object
         """
         # Fast path: check cache without acquiring the lock
-        if sound_path_or_name in self.sounds:
-            return self.sounds[sound_path_or_name]
+        sound = self.sounds.get(sound_path_or_name)
+        if sound is not None:
+            return sound
 
         # Determine if it's an absolute path (custom sound) or just a filename
         if os.path.isabs(sound_path_or_name):
             sound_path = sound_path_or_name
         else:
-            sound_path = os.path.join(self.sounds_directory, sound_path_or_name)
-
-        if not os.path.exists(sound_path):
-            return None
+            sound_path = os.path.join(
+                self.sounds_directory,
+                self._aliases.get(sound_path_or_name, sound_path_or_name),
+            )
 
         with self._sounds_lock:
             # Re-check inside the lock (double-checked locking pattern)
-            if sound_path_or_name in self.sounds:
-                return self.sounds[sound_path_or_name]
-
-            try:
-                sound = Sound3D(sound_path)
-                sound.set_rolloff_factor(0)
+            sound = self.sounds.get(sound_path_or_name)
+            if sound is None:
+                sound = PooledSound(sound_path)
                 self.sounds[sound_path_or_name] = sound
-                return sound
-            except Exception:
-                return None
+            return sound
@@ -0,0 +1,43 @@
+# speechCommands.py - Speech sequence commands used by Hibiki
+# Part of Hibiki add-on for NVDA
+
+from speech.commands import BaseCallbackCommand
+
+
+class PlayEarconCommand(BaseCallbackCommand):
+    """
+    Plays an earcon when speech reaches this point of a speech sequence.
+
+    Inserted at the start of the speech generated for an object or control
+    field, so the earcon sounds when the synthesizer starts speaking it. If
+    the utterance is cancelled before that, e.g. because the user already
+    moved on, the command never runs and nothing is played.
+    """
+
+    def __init__(self, play, obj, plan, **kwargs):
+        """
+        Args:
+            play: Callable taking (obj, plan, **kwargs) that plays the earcon
+            obj: NVDA object used to position the earcon
+            plan: Tuple of sounds from SoundPlayer.get_plan()
+            **kwargs: Extra keyword arguments for play
+        """
+        self._play = play
+        self._obj = obj
+        self._plan = plan
+        self._kwargs = kwargs
+
+    def run(self):
+        """
+        Play the earcon.
+
+        Called by NVDA's speech manager on the main thread, so it only
+        queues the sounds for the audio thread.
+        """
+        try:
+            self._play(self._obj, self._plan, **self._kwargs)
+        except Exception:
+            pass
+
+    def __repr__(self):
+        return "PlayEarconCommand(%d sounds)" % len(self._plan)
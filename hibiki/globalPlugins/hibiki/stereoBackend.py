@@ -0,0 +1,266 @@
+# stereoBackend.py - Software stereo panning backend
+# Part of Hibiki add-on for NVDA
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import stereoPanning
+from .audioBackends import AudioBackend
+from .audioData import decode_wav, to_pcm16_mono
+from .stereoPanning import AZIMUTH_STEP, azimuth_for_position, grid_azimuth, grid_azimuths, render_stereo
+from .voicePool import MAX_VOICES
+
+# Number of sounds of each sample rate that can play at the same time, the
+# voice pool's limit, so that every voice it lets play gets a player
+PLAYERS_PER_RATE = MAX_VOICES
+
+
+class StereoBuffer(object):
+    """A mono sound and its stereo renderings, by grid azimuth and gain."""
+
+    __slots__ = ("samples", "rate", "renders", "lock")
+
+    def __init__(self, samples, rate):
+        """
+        Args:
+            samples: array('h') of 16-bit mono samples
+            rate: Sample rate in Hz
+        """
+        self.samples = samples
+        self.rate = rate
+        self.renders = {}
+        self.lock = threading.Lock()
+
+    def render(self, azimuth, gain, itd):
+        """
+        Get the rendering of the sound at a grid azimuth, rendering it once.
+
+        Args:
+            azimuth: Grid azimuth in degrees
+            gain: Volume (1.0 is unchanged)
+            itd: Whether to apply the interaural time difference
+
+        Returns:
+            bytes of interleaved 16-bit stereo samples
+        """
+        key = (azimuth, gain)
+        data = self.renders.get(key)
+        if data is None:
+            with self.lock:
+                data = self.renders.get(key)
+                if data is None:
+                    data = render_stereo(self.samples, self.rate, azimuth, gain, itd)
+                    self.renders[key] = data
+        return data
+
+    def prerender(self, azimuths, itd):
+        """
+        Render the sound at full volume at every given azimuth.
+
+        Args:
+            azimuths: Grid azimuths in degrees
+            itd: Whether to apply the interaural time difference
+        """
+        for azimuth in azimuths:
+            self.render(azimuth, 1.0, itd)
+
+
+class StereoPlayer(object):
+    """
+    A WavePlayer and the voice it currently plays for.
+
+    end_time is when the sound fed to it finishes (time.perf_counter()),
+    so an idle player can be told from a busy one.
+    """
+
+    __slots__ = ("player", "owner", "end_time")
+
+    def __init__(self, player):
+        """
+        Args:
+            player: nvwave.WavePlayer
+        """
+        self.player = player
+        self.owner = None
+        self.end_time = 0.0
+
+
+class StereoVoice(object):
+    """Voice of the stereo backend."""
+
+    __slots__ = ("_backend", "_buffer", "_azimuth", "_gain", "_player")
+
+    def __init__(self, backend, buffer):
+        self._backend = backend
+        self._buffer = buffer
+        self._azimuth = 0
+        self._gain = 1.0
+        self._player = None
+
+    def set_position(self, x, y, z):
+        self._azimuth = grid_azimuth(azimuth_for_position(x, y, z), self._backend.azimuth_step)
+
+    def set_volume(self, gain):
+        self._gain = gain
+
+    def play(self):
+        buffer = self._buffer
+        data = buffer.render(self._azimuth, self._gain, self._backend.itd)
+        self._player = self._backend.play(self, buffer.rate, data)
+
+    def play_at(self, x, y, z):
+        self.set_position(x, y, z)
+        self.play()
+
+    def stop(self):
+        if self._player is not None:
+            self._backend.stop(self, self._player)
+            self._player = None
+
+    def get_length(self):
+        buffer = self._buffer
+        return float(len(buffer.samples)) / buffer.rate if buffer.rate else 0.0
+
+    def free(self):
+        self.stop()
+
+
+class StereoBackend(AudioBackend):
+    """
+    Stereo panning through NVDA's own audio output (nvwave.WavePlayer).
+
+    Instead of 3D mixing with HRTF, each sound is rendered once per cell of
+    a grid of azimuths (every azimuth_step degrees), as equal-power stereo
+    with an optional interaural time difference, and the nearest cell is
+    played. Renderings are kept with the sound. With NumPy, they are made
+    on first use; without it, rendering is much slower, so every cell is
+    rendered on a background thread as soon as the sound is loaded, rather
+    than on the audio thread the first time it plays there.
+    Stereo conveys left and right but not elevation, so vertical positions
+    aren't rendered.
+
+    This needs none of camlorn_audio's DLLs, and NumPy only if available.
+    Rendering (see stereoPanning) doesn't need NVDA; build_addon.py checks
+    it against golden output.
+    """
+
+    name = "stereo"
+    needs_pcm = True
+
+    def __init__(self, azimuth_step=AZIMUTH_STEP, itd=True, players_per_rate=PLAYERS_PER_RATE):
+        """
+        Args:
+            azimuth_step: Azimuth step of the pan grid in degrees
+            itd: Whether to apply the interaural time difference
+            players_per_rate: Number of sounds of each sample rate that can
+                play at the same time
+        """
+        self.azimuth_step = azimuth_step
+        self.itd = itd
+        self.players_per_rate = max(1, players_per_rate)
+        # Sample rate -> list of StereoPlayers
+        self._players = {}
+        # Single thread rendering loaded sounds without NumPy, created on
+        # the first load
+        self._renderer = None
+        self._WavePlayer = None
+        self._output_device = None
+
+    def start(self):
+        import nvwave
+        self._WavePlayer = nvwave.WavePlayer
+        try:
+            import config
+            try:
+                self._output_device = config.conf["audio"]["outputDevice"]
+            except KeyError:
+                self._output_device = config.conf["speech"]["outputDevice"]
+        except Exception:
+            self._output_device = None
+
+    def load_buffer(self, path, decoded=None, stream=False):
+        # Renderings need the whole sound, so streaming isn't supported
+        if decoded is None:
+            decoded = decode_wav(path)
+        buffer = StereoBuffer(to_pcm16_mono(decoded), decoded.rate)
+        if stereoPanning.numpy is None:
+            if self._renderer is None:
+                self._renderer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="HibikiStereo")
+            self._renderer.submit(buffer.prerender, grid_azimuths(self.azimuth_step), self.itd)
+        return buffer
+
+    def create_voice(self, buffer):
+        return StereoVoice(self, buffer)
+
+    def _create_player(self, rate):
+        """
+        Create a stereo 16-bit WavePlayer.
+
+        Args:
+            rate: Sample rate in Hz
+
+        Returns:
+            nvwave.WavePlayer
+        """
+        if self._output_device is not None:
+            return self._WavePlayer(2, rate, 16, outputDevice=self._output_device, wantDucking=False)
+        return self._WavePlayer(2, rate, 16, wantDucking=False)
+
+    def play(self, voice, rate, data):
+        """
+        Play stereo data on a player of its sample rate.
+
+        An idle player is used if there is one, then a new player while
+        there are fewer than players_per_rate; otherwise the player that
+        would finish first is cut off.
+
+        Args:
+            voice: StereoVoice playing the data
+            rate: Sample rate in Hz
+            data: bytes of interleaved 16-bit stereo samples
+
+        Returns:
+            The StereoPlayer playing the data
+        """
+        players = self._players.setdefault(rate, [])
+        now = time.perf_counter()
+        chosen = min(players, key=lambda player: player.end_time, default=None)
+        if chosen is None or (chosen.end_time > now and len(players) < self.players_per_rate):
+            chosen = StereoPlayer(self._create_player(rate))
+            players.append(chosen)
+        elif chosen.end_time > now:
+            chosen.player.stop()
+        chosen.owner = voice
+        chosen.end_time = now + len(data) / (4.0 * rate)
+        chosen.player.feed(data)
+        return chosen
+
+    def stop(self, voice, player):
+        """
+        Stop a player, unless another voice has been given it since.
+
+        Args:
+            voice: StereoVoice that played on the player
+            player: StereoPlayer returned by play()
+        """
+        if player.owner is not voice:
+            return
+        player.owner = None
+        player.end_time = 0.0
+        try:
+            player.player.stop()
+        except Exception:
+            pass
+
+    def terminate(self):
+        if self._renderer is not None:
+            self._renderer.shutdown(wait=True, cancel_futures=True)
+            self._renderer = None
+        for players in self._players.values():
+            for player in players:
+                try:
+                    player.player.stop()
+                    player.player.close()
+                except Exception:
+                    pass
+        self._players.clear()
@@ -0,0 +1,159 @@
+# stereoPanning.py - Stereo rendering of mono sounds
+# Part of Hibiki add-on for NVDA
+#
+# This module only uses the standard library (and NumPy if available), so
+# build_addon.py can import it to check the rendering against golden output.
+
+import math
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Azimuth step of the pan grid in degrees; positions are rounded to it
+AZIMUTH_STEP = 10
+
+# Maximum interaural time difference in seconds (sound straight to one side)
+MAX_ITD = 0.00066
+
+
+def azimuth_for_position(x, y, z):
+    """
+    Get the azimuth of a position in audio space, seen from the listener.
+
+    Args:
+        x: X coordinate (negative is left)
+        y: Y coordinate (unused: stereo can't convey elevation)
+        z: Z coordinate (negative is in front)
+
+    Returns:
+        Azimuth in degrees, from -90 (left) to 90 (right)
+    """
+    azimuth = math.degrees(math.atan2(x, -z))
+    return max(-90.0, min(90.0, azimuth))
+
+
+def grid_azimuth(azimuth, step=AZIMUTH_STEP):
+    """
+    Round an azimuth to the pan grid.
+
+    Args:
+        azimuth: Azimuth in degrees
+        step: Grid step in degrees
+
+    Returns:
+        Azimuth of the nearest grid cell, as an int
+    """
+    return int(round(azimuth / float(step))) * step
+
+
+def grid_azimuths(step=AZIMUTH_STEP):
+    """
+    List every cell of the pan grid.
+
+    Args:
+        step: Grid step in degrees
+
+    Returns:
+        List of grid azimuths from left to right
+    """
+    last = grid_azimuth(90, step)
+    return list(range(-last, last + 1, step))
+
+
+def _get_panning(rate, azimuth, gain, itd):
+    """
+    Get the channel gains and delays of a panned sound.
+
+    Uses equal-power panning; with itd, the ear further from the source
+    also hears it slightly later (Woodworth's spherical head model).
+
+    Args:
+        rate: Sample rate in Hz
+        azimuth: Azimuth in degrees, from -90 (left) to 90 (right)
+        gain: Volume (1.0 is unchanged)
+        itd: Whether to apply the interaural time difference
+
+    Returns:
+        tuple (left gain, right gain, left delay, right delay), delays in
+        frames
+    """
+    theta = (azimuth / 90.0 + 1.0) * math.pi / 4.0
+    delay = 0
+    if itd:
+        angle = math.radians(abs(azimuth))
+        delay = int(round(MAX_ITD * (angle + math.sin(angle)) / (math.pi / 2.0 + 1.0) * rate))
+    # Delay the far ear: the right one for sources on the left
+    return (
+        math.cos(theta) * gain,
+        math.sin(theta) * gain,
+        delay if azimuth > 0 else 0,
+        delay if azimuth < 0 else 0,
+    )
+
+
+def render_stereo_python(samples, rate, azimuth, gain=1.0, itd=True):
+    """
+    Render mono samples as stereo panned to an azimuth, without NumPy.
+
+    This is the reference rendering: render_stereo() gives the same output
+    with or without NumPy.
+
+    Args:
+        samples: array('h') of 16-bit mono samples
+        rate: Sample rate in Hz
+        azimuth: Azimuth in degrees, from -90 (left) to 90 (right)
+        gain: Volume (1.0 is unchanged)
+        itd: Whether to apply the interaural time difference
+
+    Returns:
+        bytes of interleaved 16-bit stereo samples
+    """
+    left_gain, right_gain, left_delay, right_delay = _get_panning(rate, azimuth, gain, itd)
+    frames = len(samples) + max(left_delay, right_delay)
+
+    def channel(channel_gain, channel_delay):
+        values = array('h', bytes(channel_delay * 2))
+        if -1.0 <= channel_gain <= 1.0:
+            # Scaled 16-bit samples can't overflow
+            values.extend([int(value * channel_gain) for value in samples])
+        else:
+            values.extend([min(32767, max(-32768, int(value * channel_gain))) for value in samples])
+        values.extend(array('h', bytes((frames - len(values)) * 2)))
+        return values
+
+    stereo = array('h', bytes(frames * 4))
+    stereo[0::2] = channel(left_gain, left_delay)
+    stereo[1::2] = channel(right_gain, right_delay)
+    return stereo.tobytes()
+
+
+def render_stereo(samples, rate, azimuth, gain=1.0, itd=True):
+    """
+    Render mono samples as stereo panned to an azimuth.
+
+    Uses NumPy if available, and render_stereo_python() otherwise. Samples
+    are scaled in double precision and truncated, so both give the same
+    output.
+
+    Args:
+        samples: array('h') of 16-bit mono samples
+        rate: Sample rate in Hz
+        azimuth: Azimuth in degrees, from -90 (left) to 90 (right)
+        gain: Volume (1.0 is unchanged)
+        itd: Whether to apply the interaural time difference
+
+    Returns:
+        bytes of interleaved 16-bit stereo samples
+    """
+    if numpy is None:
+        return render_stereo_python(samples, rate, azimuth, gain, itd)
+    left_gain, right_gain, left_delay, right_delay = _get_panning(rate, azimuth, gain, itd)
+    frames = len(samples) + max(left_delay, right_delay)
+    mono = numpy.frombuffer(samples.tobytes(), dtype=numpy.int16).astype(numpy.float64)
+    stereo = numpy.zeros((frames, 2), dtype=numpy.float64)
+    stereo[left_delay:left_delay + len(mono), 0] = mono * left_gain
+    stereo[right_delay:right_delay + len(mono), 1] = mono * right_gain
+    return numpy.clip(stereo, -32768, 32767).astype(numpy.int16).tobytes()
@@ -0,0 +1,177 @@
+# voicePool.py - Pool of playable voices shared by all sounds
+# Part of Hibiki add-on for NVDA
+
+import threading
+import time
+
+# Default maximum number of voices (sources) playing at the same time
+MAX_VOICES = 16
+
+# Default maximum number of voices allocated for a single sound
+VOICES_PER_SOUND = 3
+
+
+class PooledSound(object):
+    """
+    A sound and the voices that can play it.
+
+    A PooledSound starts without voices; the first voice is created when the
+    sound is loaded. Additional voices are allocated by VoicePool on demand,
+    up to its voices_per_sound limit. If loading fails, failed is set and
+    the sound is skipped until retry_time; failed_mtime is the modification
+    time of the file when it failed (None if it was missing). pcm holds the
+    decoded audio (DecodedSound) when it was decoded in Python while loading,
+    for backends that need it, and buffer the audio backend's buffer once the sound is loaded.
+    """
+
+    __slots__ = (
+        "path", "voices", "length", "next_voice",
+        "failed", "failed_mtime", "retry_time",
+        "pcm", "buffer",
+    )
+
+    def __init__(self, path):
+        """
+        Args:
+            path: Absolute path of the sound file
+        """
+        self.path = path
+        self.voices = []
+        # Duration in seconds, known once the sound is loaded
+        self.length = 0.0
+        self.next_voice = 0
+        self.failed = False
+        self.failed_mtime = None
+        self.retry_time = 0.0
+        self.pcm = None
+        self.buffer = None
+
+    @property
+    def loaded(self):
+        """True once the sound has at least one voice."""
+        return bool(self.voices)
+
+
+class VoicePool(object):
+    """
+    Allocates voices for overlapping playback with a cap on concurrency.
+
+    Each sound may own several voices, used round-robin, so that playing
+    the same sound twice in quick succession (e.g. two list items in a row)
+    no longer restarts and moves the earcon that is still playing. When all
+    voices of a sound are busy and no more may be created, the oldest one is
+    reused. When max_voices are already playing, the oldest playing voice
+    is stopped before a new one starts, which keeps mixer load bounded.
+    """
+
+    def __init__(self, create_voice, max_voices=MAX_VOICES, voices_per_sound=VOICES_PER_SOUND):
+        """
+        Args:
+            create_voice: Callable taking a sound's buffer and returning a new voice
+            max_voices: Maximum number of voices playing at the same time
+            voices_per_sound: Maximum number of voices per sound
+        """
+        self._create_voice = create_voice
+        self.max_voices = max(1, max_voices)
+        self.voices_per_sound = max(1, voices_per_sound)
+        # Playing voices as [end_time, voice] in start order
+        self._playing = []
+        self._lock = threading.Lock()
+        self.steals = 0
+
+    def acquire(self, sound):
+        """
+        Get a voice to play a sound on, stopping another voice if needed.
+
+        The returned voice is recorded as playing for the sound's duration.
+
+        Args:
+            sound: PooledSound to play
+
+        Returns:
+            Voice object ready to be positioned and played
+        """
+        with self._lock:
+            now = time.monotonic()
+            playing = [entry for entry in self._playing if entry[0] > now]
+            busy = set(id(entry[1]) for entry in playing)
+
+            voice = self._pick_voice(sound, busy)
+
+            # The chosen voice may still be playing (stolen); forget that entry
+            playing = [entry for entry in playing if entry[1] is not voice]
+
+            # Enforce the global concurrency cap by stopping the oldest voices
+            while len(playing) >= self.max_voices:
+                _end, oldest = playing.pop(0)
+                self.steals += 1
+                try:
+                    oldest.stop()
+                except Exception:
+                    pass
+
+            playing.append([now + sound.length, voice])
+            self._playing = playing
+            return voice
+
+    def _pick_voice(self, sound, busy):
+        """
+        Choose the voice of a sound to use next.
+
+        Prefers an idle voice in round-robin order, then allocates a new voice
+        if the per-sound limit allows, and finally steals the oldest voice.
+
+        Args:
+            sound: PooledSound to play
+            busy: Set of id() of voices currently playing
+
+        Returns:
+            Voice object
+        """
+        voices = sound.voices
+        count = len(voices)
+        for offset in range(count):
+            index = (sound.next_voice + offset) % count
+            if id(voices[index]) not in busy:
+                sound.next_voice = (index + 1) % count
+                return voices[index]
+
+        if count < self.voices_per_sound:
+            try:
+                voice = self._create_voice(sound.buffer)
+            except Exception:
+                voice = None
+            if voice is not None:
+                voices.append(voice)
+                sound.next_voice = 0
+                return voice
+
+        # All voices busy: reuse the oldest one (next in round-robin order)
+        index = sound.next_voice % count
+        sound.next_voice = (index + 1) % count
+        self.steals += 1
+        return voices[index]
+
+    def release(self, voice):
+        """
+        Stop a voice and make it available again.
+
+        Args:
+            voice: Voice object returned by acquire()
+        """
+        with self._lock:
+            self._playing = [entry for entry in self._playing if entry[1] is not voice]
+        try:
+            voice.stop()
+        except Exception:
+            pass
+
+    def stop_all(self):
+        """Stop every playing voice."""
+        with self._lock:
+            for _end, voice in self._playing:
+                try:
+                    voice.stop()
+                except Exception:
+                    pass
+            self._playing = []